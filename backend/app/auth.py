@@ -1,22 +1,31 @@
 from fastapi import APIRouter, Request, Query, UploadFile, File, Header
-from fastapi.responses import RedirectResponse, HTMLResponse
+from fastapi.responses import RedirectResponse, HTMLResponse, StreamingResponse
+from pydantic import BaseModel
 from google_auth_oauthlib.flow import Flow
-from googleapiclient.discovery import build
 from google.oauth2 import id_token as google_id_token
 from google.auth.transport import requests as google_requests
-from googleapiclient.http import MediaIoBaseDownload, MediaIoBaseUpload
-from app.config import CREDENTIALS_PATH, SCOPES
+from app.config import CREDENTIALS_PATH, SCOPES, FACE_BATCH_MAX_IMAGES
 from app.redis_client import redis_client
+from app.drive_scheduler import drive_scheduler
+from app.drive_service import get_drive_service
+from app.folder_scan import scan_folder_tree
+from app.metadata_index import metadata_indexes
+from app.folder_cache import folder_parents
+from app.listing_cache import listing_cache
+from app.face_gallery import face_gallery
+from app.face_workers import face_workers
+from app.transfers import transfer_drive_file, is_same_account, transfer_checkpoint_key
+from app.transfer_jobs import transfer_job_manager
+from app.sync import run_sync, SyncBusy
+from app.progress import publish_transfer_done
 import os
 import traceback
-import io
 import json
 import numpy as np
-import face_recognition
-import shutil
+import asyncio
 import time
 import logging
-from typing import Optional
+from typing import Optional, List
 from datetime import datetime
 from google.auth import exceptions as google_exceptions
 
@@ -100,6 +109,7 @@ def google_callback(request: Request):
     try:
         flow.fetch_token(authorization_response=full_url)
         credentials = flow.credentials
+        email = None
         
         # Use robust token verification with retry logic
         if credentials.id_token:
@@ -115,7 +125,7 @@ def google_callback(request: Request):
                 )
         
         # Store credentials in Redis using generated token
-        token = redis_client.store_credentials(credentials, "general")
+        token = redis_client.store_credentials(credentials, "general", email=email)
         
         return HTMLResponse(content=f"<h2>✅ Login Successful</h2><p>Email: {email}</p><p>Token: {token}</p>", status_code=200)
     except Exception as e:
@@ -148,6 +158,7 @@ def source_callback(request: Request):
         
         flow.fetch_token(authorization_response=full_url)
         credentials = flow.credentials
+        email = None
         
         # Verify ID token with retry logic and clock skew tolerance
         if credentials.id_token:
@@ -163,7 +174,7 @@ def source_callback(request: Request):
                 )
         
         # Store credentials in Redis
-        token = redis_client.store_credentials(credentials, "source")
+        token = redis_client.store_credentials(credentials, "source", email=email)
         
         logger.info(f"Source credentials stored with token: {token}")
         
@@ -197,6 +208,7 @@ def destination_callback(request: Request):
         
         flow.fetch_token(authorization_response=full_url)
         credentials = flow.credentials
+        email = None
         
         # Verify ID token with retry logic and clock skew tolerance
         if credentials.id_token:
@@ -212,7 +224,7 @@ def destination_callback(request: Request):
                 )
         
         # Store credentials in Redis
-        token = redis_client.store_credentials(credentials, "destination")
+        token = redis_client.store_credentials(credentials, "destination", email=email)
         
         logger.info(f"Destination credentials stored with token: {token}")
         
@@ -248,7 +260,15 @@ def list_drive_files(
         return {"error": "Invalid token or session expired"}
 
     try:
-        service = build("drive", "v3", credentials=credentials)
+        account = redis_client.get_account_key(token)
+        cache_key = listing_cache.key(account, "list-files", {
+            "page_token": page_token, "page_size": page_size, "search_query": search_query
+        })
+        cached = listing_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        service = get_drive_service(credentials)
         
         # Build query
         query = "trashed = false"
@@ -257,16 +277,17 @@ def list_drive_files(
             query += f" and (name contains '{search_query}' or fullText contains '{search_query}')"
         
         # Make the API request
-        results = service.files().list(
+        results = drive_scheduler.execute(service.files().list(
             q=query,
             pageSize=page_size,
             pageToken=page_token,
             fields="nextPageToken, files(id, name, mimeType, size, modifiedTime, createdTime, parents, webViewLink)",
             orderBy="modifiedTime desc"  # Most recently modified first
-        ).execute()
+        ))
         
         files = results.get("files", [])
         next_page_token = results.get("nextPageToken")
+        folder_parents.remember(account, files)
         
         # Format file sizes for better readability
         for file in files:
@@ -275,7 +296,7 @@ def list_drive_files(
             else:
                 file["sizeFormatted"] = "N/A"
                 
-        return {
+        response = {
             "files": files,
             "nextPageToken": next_page_token,
             "hasMorePages": next_page_token is not None,
@@ -283,6 +304,8 @@ def list_drive_files(
             "searchQuery": search_query,
             "totalFilesInPage": len(files)
         }
+        listing_cache.put(cache_key, response)
+        return response
     except Exception as e:
         logger.error(f"Error in list_drive_files: {e}")
         return {"error": str(e)}
@@ -307,25 +330,34 @@ def list_destination_folders(
         return {"error": "Invalid token or session expired"}
 
     try:
-        service = build("drive", "v3", credentials=credentials)
+        account = redis_client.get_account_key(token)
+        cache_key = listing_cache.key(account, "list-folders", {
+            "page_token": page_token, "page_size": page_size, "search_query": search_query
+        })
+        cached = listing_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        service = get_drive_service(credentials)
         
         # Build query for folders only
         query = "mimeType = 'application/vnd.google-apps.folder' and trashed = false"
         if search_query:
             query += f" and name contains '{search_query}'"
         
-        results = service.files().list(
+        results = drive_scheduler.execute(service.files().list(
             q=query,
             pageSize=page_size,
             pageToken=page_token,
             fields="nextPageToken, files(id, name, createdTime, modifiedTime, parents)",
             orderBy="name"  # Alphabetical order for folders
-        ).execute()
+        ))
         
         folders = results.get("files", [])
         next_page_token = results.get("nextPageToken")
+        folder_parents.remember(account, folders, all_folders=True)
         
-        return {
+        response = {
             "folders": folders,
             "nextPageToken": next_page_token,
             "hasMorePages": next_page_token is not None,
@@ -333,6 +365,8 @@ def list_destination_folders(
             "searchQuery": search_query,
             "totalFoldersInPage": len(folders)
         }
+        listing_cache.put(cache_key, response)
+        return response
     except Exception as e:
         logger.error(f"Error in list_destination_folders: {e}")
         return {"error": str(e)}
@@ -355,7 +389,7 @@ def list_drive_files_advanced(
         return {"error": "Invalid token or session expired"}
 
     try:
-        service = build("drive", "v3", credentials=credentials)
+        service = get_drive_service(credentials)
         
         # Build complex query
         query_parts = ["trashed = false"]
@@ -376,16 +410,30 @@ def list_drive_files_advanced(
         if order_by not in valid_orders:
             order_by = "modifiedTime desc"
         
-        results = service.files().list(
-            q=query,
-            pageSize=page_size,
-            pageToken=page_token,
-            fields="nextPageToken, files(id, name, mimeType, size, modifiedTime, createdTime, parents, webViewLink, thumbnailLink)",
-            orderBy=order_by
-        ).execute()
-        
-        files = results.get("files", [])
-        next_page_token = results.get("nextPageToken")
+        # Full-text search needs Drive, everything else can come from the metadata index
+        index = None if search_query else metadata_indexes.for_request(token, credentials, page_token)
+        if index and folder_id and index.get_file(folder_id) is None:
+            index = None  # A folder the index does not know yet is listed from Drive
+        if index:
+            files, next_page_token = index.list_files(
+                parent_id=folder_id,
+                mime_type=mime_type_filter,
+                order_by=order_by,
+                page_token=page_token,
+                page_size=page_size
+            )
+        else:
+            results = drive_scheduler.execute(service.files().list(
+                q=query,
+                pageSize=page_size,
+                pageToken=page_token,
+                fields="nextPageToken, files(id, name, mimeType, size, modifiedTime, createdTime, parents, webViewLink, thumbnailLink)",
+                orderBy=order_by
+            ))
+            
+            files = results.get("files", [])
+            next_page_token = results.get("nextPageToken")
+        folder_parents.remember(redis_client.get_account_key(token), files)
         
         # Add formatted file sizes and type categorization
         for file in files:
@@ -408,7 +456,8 @@ def list_drive_files_advanced(
                 "folderId": folder_id,
                 "orderBy": order_by
             },
-            "totalFilesInPage": len(files)
+            "totalFilesInPage": len(files),
+            "source": "index" if index else "drive"
         }
     except Exception as e:
         logger.error(f"Error in list_drive_files_advanced: {e}")
@@ -439,14 +488,35 @@ def list_folder_contents(
         return {"error": "Invalid token or session expired"}
 
     try:
-        service = build("drive", "v3", credentials=credentials)
+        service = get_drive_service(credentials)
+        account = redis_client.get_account_key(token)
+        
+        # Accounts with a metadata index are browsed locally; folders it
+        # does not know yet fall back to Drive
+        index = metadata_indexes.for_request(token, credentials, page_token)
+        folder_info = index.get_file(folder_id) if index else None
+        if folder_info is None:
+            index = None
+        
+        # Live listings are shared between workers for a short time
+        cache_key = None
+        if not index:
+            cache_key = listing_cache.key(account, "list-folder-contents", {
+                "folder_id": folder_id, "page_token": page_token, "page_size": page_size,
+                "search_query": search_query, "include_folders": include_folders,
+                "include_files": include_files, "order_by": order_by
+            }, folder_id=folder_id)
+            cached = listing_cache.get(cache_key)
+            if cached is not None:
+                return cached
         
         # First, get information about the folder itself
         try:
-            folder_info = service.files().get(
-                fileId=folder_id,
-                fields="id, name, mimeType, createdTime, modifiedTime, parents"
-            ).execute()
+            if folder_info is None:
+                folder_info = drive_scheduler.execute(service.files().get(
+                    fileId=folder_id,
+                    fields="id, name, mimeType, createdTime, modifiedTime, parents"
+                ))
             
             # Verify it's actually a folder
             if folder_info.get("mimeType") != "application/vnd.google-apps.folder":
@@ -497,16 +567,27 @@ def list_folder_contents(
                 }
             }
         
-        results = service.files().list(
-            q=query,
-            pageSize=page_size,
-            pageToken=page_token,
-            fields="nextPageToken, files(id, name, mimeType, size, modifiedTime, createdTime, parents, webViewLink, thumbnailLink)",
-            orderBy=order_by
-        ).execute()
-        
-        items = results.get("files", [])
-        next_page_token = results.get("nextPageToken")
+        if index:
+            items, next_page_token = index.list_files(
+                parent_id=folder_id,
+                folders=include_folders if include_folders != include_files else None,
+                name_contains=search_query,
+                order_by=order_by,
+                page_token=page_token,
+                page_size=page_size
+            )
+        else:
+            results = drive_scheduler.execute(service.files().list(
+                q=query,
+                pageSize=page_size,
+                pageToken=page_token,
+                fields="nextPageToken, files(id, name, mimeType, size, modifiedTime, createdTime, parents, webViewLink, thumbnailLink)",
+                orderBy=order_by
+            ))
+            
+            items = results.get("files", [])
+            next_page_token = results.get("nextPageToken")
+        folder_parents.remember(account, items + [folder_info])
         
         # Process items and add additional metadata
         file_count = 0
@@ -534,7 +615,7 @@ def list_folder_contents(
         if order_by == "folder,name":
             items.sort(key=lambda x: (not x.get("isFolder", False), x.get("name", "").lower()))
         
-        return {
+        response = {
             "items": items,
             "nextPageToken": next_page_token,
             "hasMorePages": next_page_token is not None,
@@ -556,8 +637,11 @@ def list_folder_contents(
                 "includeFiles": include_files,
                 "includeFolders": include_folders,
                 "orderBy": order_by
-            }
+            },
+            "source": "index" if index else "drive"
         }
+        listing_cache.put(cache_key, response)
+        return response
     except Exception as e:
         logger.error(f"Error in list_folder_contents: {e}")
         return {"error": str(e)}
@@ -568,31 +652,40 @@ def list_folder_contents_recursive(
     folder_id: str = Query(..., description="ID of the folder to recursively list contents from"),
     max_depth: int = Query(3, ge=1, le=10, description="Maximum depth to recurse (1-10)"),
     files_only: bool = Query(False, description="Return only files, exclude folders from results"),
-    file_types: Optional[str] = Query(None, description="Comma-separated list of file categories to include (e.g., 'document,image,video')")
+    file_types: Optional[str] = Query(None, description="Comma-separated list of file categories to include (e.g., 'document,image,video')"),
+    format: str = Query("json", description="'json' for one document, 'ndjson' to stream one record per line")
 ):
     """
     Recursively get all files within a folder and its subfolders.
     
-    Warning: This can be slow for large folder structures. Use with caution.
+    Folders are listed concurrently, so the scan takes roughly one
+    round trip per level of depth rather than one per folder.
     
     Returns:
     - files: List of all files found recursively
     - folderStructure: Hierarchical structure of folders
     - summary: Statistics about the scan
+
+    With format=ndjson, records are streamed as folders are scanned, one
+    JSON object per line: {"type": "folder"}, {"type": "file"} and
+    {"type": "error"} records in discovery order, then one {"type": "summary"}.
     """
+    if format not in ("json", "ndjson"):
+        return {"error": "format must be 'json' or 'ndjson'"}
+
     credentials = redis_client.get_credentials_by_token(token)
     if not credentials:
         return {"error": "Invalid token or session expired"}
 
     try:
-        service = build("drive", "v3", credentials=credentials)
+        service = get_drive_service(credentials)
         
         # Verify the root folder exists
         try:
-            root_folder = service.files().get(
+            root_folder = drive_scheduler.execute(service.files().get(
                 fileId=folder_id,
                 fields="id, name, mimeType"
-            ).execute()
+            ))
             
             if root_folder.get("mimeType") != "application/vnd.google-apps.folder":
                 return {"error": "Specified ID is not a folder"}
@@ -605,94 +698,114 @@ def list_folder_contents_recursive(
         if file_types:
             allowed_categories = [cat.strip().lower() for cat in file_types.split(",")]
         
+        account = redis_client.get_account_key(token)
+        
+        def folder_records(listing):
+            """Split one folder listing into its structure entry and matching files"""
+            folder_parents.remember(account, listing["items"])
+            current_path = listing["path"]
+            folder_files = []
+            subfolders = []
+            
+            for item in listing["items"]:
+                if item.get("mimeType") == "application/vnd.google-apps.folder":
+                    # It's a subfolder
+                    subfolders.append({
+                        "id": item["id"],
+                        "name": item["name"],
+                        "path": f"{current_path}/{item['name']}" if current_path else item["name"]
+                    })
+                else:
+                    # It's a file
+                    file_info = {
+                        "id": item["id"],
+                        "name": item["name"],
+                        "mimeType": item.get("mimeType", ""),
+                        "size": item.get("size"),
+                        "modifiedTime": item.get("modifiedTime"),
+                        "createdTime": item.get("createdTime"),
+                        "webViewLink": item.get("webViewLink"),
+                        "path": f"{current_path}/{item['name']}" if current_path else item["name"],
+                        "parentFolderId": listing["id"]
+                    }
+                    
+                    # Add formatted size and category
+                    if file_info.get("size"):
+                        file_info["sizeFormatted"] = format_file_size(int(file_info["size"]))
+                    else:
+                        file_info["sizeFormatted"] = "N/A"
+                    
+                    file_info["category"] = categorize_file_type(file_info["mimeType"])
+                    
+                    # Apply file type filter if specified
+                    if allowed_categories is None or file_info["category"] in allowed_categories:
+                        folder_files.append(file_info)
+            
+            folder_entry = {
+                "id": listing["id"],
+                "path": current_path or "/",
+                "files": folder_files,
+                "subfolders": subfolders,
+                "fileCount": len(folder_files),
+                "subfolderCount": len(subfolders)
+            }
+            return folder_entry, folder_files
+        
+        # Folders are listed concurrently, breadth-first, following every result page
+        listings = scan_folder_tree(credentials, folder_id, root_folder["name"], max_depth)
+        
+        if format == "ndjson":
+            def stream_records():
+                total_files = 0
+                total_folders_scanned = 0
+                try:
+                    for listing in listings:
+                        total_folders_scanned += 1
+                        if listing.get("error"):
+                            yield json.dumps({"type": "error", "folderId": listing["id"],
+                                              "path": listing["path"], "error": listing["error"]}) + "\n"
+                            continue
+                        
+                        folder_entry, folder_files = folder_records(listing)
+                        if not files_only:
+                            folder_entry = {key: value for key, value in folder_entry.items() if key != "files"}
+                            yield json.dumps({"type": "folder", **folder_entry}) + "\n"
+                        for file_info in folder_files:
+                            yield json.dumps({"type": "file", **file_info}) + "\n"
+                        total_files += len(folder_files)
+                finally:
+                    listings.close()
+                
+                yield json.dumps({
+                    "type": "summary",
+                    "rootFolder": {"id": root_folder["id"], "name": root_folder["name"]},
+                    "totalFiles": total_files,
+                    "totalFoldersScanned": total_folders_scanned,
+                    "maxDepthReached": max_depth,
+                    "filesOnly": files_only,
+                    "fileTypeFilter": file_types
+                }) + "\n"
+            
+            return StreamingResponse(stream_records(), media_type="application/x-ndjson")
+        
         all_files = []
         folder_structure = []
         total_folders_scanned = 0
-        total_files_found = 0
         
-        def scan_folder_recursive(current_folder_id, current_path="", depth=0):
-            nonlocal total_folders_scanned, total_files_found
-            
-            if depth >= max_depth:
-                return
-            
+        for listing in listings:
             total_folders_scanned += 1
+            if listing.get("error"):
+                continue
             
-            # Get all items in current folder
-            try:
-                results = service.files().list(
-                    q=f"'{current_folder_id}' in parents and trashed = false",
-                    fields="files(id, name, mimeType, size, modifiedTime, createdTime, parents, webViewLink)",
-                    pageSize=1000  # Get as many as possible in one request
-                ).execute()
-                
-                items = results.get("files", [])
-                folder_files = []
-                subfolders = []
-                
-                for item in items:
-                    if item.get("mimeType") == "application/vnd.google-apps.folder":
-                        # It's a subfolder
-                        subfolder_info = {
-                            "id": item["id"],
-                            "name": item["name"],
-                            "path": f"{current_path}/{item['name']}" if current_path else item["name"]
-                        }
-                        subfolders.append(subfolder_info)
-                        
-                        # Recursively scan subfolder
-                        scan_folder_recursive(
-                            item["id"], 
-                            subfolder_info["path"], 
-                            depth + 1
-                        )
-                    else:
-                        # It's a file
-                        total_files_found += 1
-                        
-                        # Add file metadata
-                        file_info = {
-                            "id": item["id"],
-                            "name": item["name"],
-                            "mimeType": item.get("mimeType", ""),
-                            "size": item.get("size"),
-                            "modifiedTime": item.get("modifiedTime"),
-                            "createdTime": item.get("createdTime"),
-                            "webViewLink": item.get("webViewLink"),
-                            "path": f"{current_path}/{item['name']}" if current_path else item["name"],
-                            "parentFolderId": current_folder_id
-                        }
-                        
-                        # Add formatted size and category
-                        if file_info.get("size"):
-                            file_info["sizeFormatted"] = format_file_size(int(file_info["size"]))
-                        else:
-                            file_info["sizeFormatted"] = "N/A"
-                        
-                        file_info["category"] = categorize_file_type(file_info["mimeType"])
-                        
-                        # Apply file type filter if specified
-                        if allowed_categories is None or file_info["category"] in allowed_categories:
-                            folder_files.append(file_info)
-                            all_files.append(file_info)
-                
-                # Add folder to structure (unless files_only is True)
-                if not files_only:
-                    folder_structure.append({
-                        "id": current_folder_id,
-                        "path": current_path or "/",
-                        "files": folder_files,
-                        "subfolders": subfolders,
-                        "fileCount": len(folder_files),
-                        "subfolderCount": len(subfolders)
-                    })
-                    
-            except Exception as e:
-                logger.error(f"Error scanning folder {current_folder_id}: {e}")
-                return
+            folder_entry, folder_files = folder_records(listing)
+            all_files.extend(folder_files)
+            
+            # Add folder to structure (unless files_only is True)
+            if not files_only:
+                folder_structure.append(folder_entry)
         
-        # Start recursive scan
-        scan_folder_recursive(folder_id, root_folder["name"])
+        # Folders finish in any order, keep the structure stable
+        folder_structure.sort(key=lambda x: x["path"].lower())
         
         # Sort files by path for better organization
         all_files.sort(key=lambda x: x.get("path", "").lower())
@@ -739,18 +852,43 @@ def get_folder_path(
         return {"error": "Invalid token or session expired"}
 
     try:
-        service = build("drive", "v3", credentials=credentials)
+        index = metadata_indexes.for_request(token, credentials)
+        if index:
+            folder = index.get_file(folder_id)
+            if folder and folder.get("mimeType") != "application/vnd.google-apps.folder":
+                return {"error": "Specified ID is not a folder"}
+            path = index.folder_path(folder_id) if folder else []
+            if path:
+                return {
+                    "path": path,
+                    "fullPath": " / ".join([folder["name"] for folder in path]),
+                    "folderId": folder_id,
+                    "depth": len(path)
+                }
+        
+        service = get_drive_service(credentials)
+        account = redis_client.get_account_key(token)
         
         path = []
         current_id = folder_id
+        seen = set()
         
-        # Traverse up the folder hierarchy
-        while current_id:
+        # Traverse up the folder hierarchy; only ancestors missing from the
+        # breadcrumb cache cost a Drive call
+        while current_id and current_id not in seen:
+            seen.add(current_id)
+            cached = folder_parents.get(account, current_id)
+            if cached:
+                name, parent_id = cached
+                path.append({"id": current_id, "name": name})
+                current_id = parent_id
+                continue
+            
             try:
-                folder = service.files().get(
+                folder = drive_scheduler.execute(service.files().get(
                     fileId=current_id,
                     fields="id, name, mimeType, parents"
-                ).execute()
+                ))
                 
                 # Verify it's a folder
                 if folder.get("mimeType") != "application/vnd.google-apps.folder":
@@ -759,25 +897,26 @@ def get_folder_path(
                     else:
                         break  # We've reached a non-folder parent, stop here
                 
-                # Add to path (we'll reverse it later)
-                path.insert(0, {
+                folder_parents.remember(account, [folder])
+                
+                # Add to path (reversed once the root is reached)
+                path.append({
                     "id": folder["id"],
                     "name": folder["name"]
                 })
                 
-                # Move to parent folder
+                # Move to parent folder; Google Drive items typically have one parent
+                # and "My Drive" has none
                 parents = folder.get("parents", [])
-                if parents:
-                    current_id = parents[0]  # Google Drive items typically have one parent
-                else:
-                    # Reached root (My Drive)
-                    break
+                current_id = parents[0] if parents else None
                     
             except Exception as e:
                 # If we can't access a parent folder, stop traversal
                 logger.warning(f"Could not access folder {current_id}: {e}")
                 break
         
+        path.reverse()
+        
         # Create full path string
         if path:
             full_path = " / ".join([folder["name"] for folder in path])
@@ -795,94 +934,256 @@ def get_folder_path(
         logger.error(f"Error in get_folder_path: {e}")
         return {"error": str(e)}
 
+@router.post("/metadata-index")
+def build_metadata_index(token: str = Query(...)):
+    """
+    Opt in to a local metadata index of the account's whole Drive.
+
+    The index is built in the background with one full crawl and then
+    kept fresh from the Changes API. Once ready, /list-folder-contents,
+    /get-folder-path and /list-files-advanced (without search) are served
+    from it without Drive calls.
+    """
+    credentials = redis_client.get_credentials_by_token(token)
+    if not credentials:
+        return {"error": "Invalid token or session expired"}
+
+    try:
+        metadata_indexes.build(token, credentials)
+        return {"message": "Metadata index build started", "status": "building"}
+    except Exception as e:
+        logger.error(f"Error in build_metadata_index: {e}")
+        return {"error": str(e)}
+
+@router.get("/metadata-index")
+def get_metadata_index(token: str = Query(...)):
+    """Get the build status and size of the account's metadata index"""
+    if not redis_client.get_credentials_by_token(token):
+        return {"error": "Invalid token or session expired"}
+
+    index = metadata_indexes.get(token)
+    if index is None:
+        return {"status": "missing"}
+    return index.status()
+
+@router.delete("/metadata-index")
+def delete_metadata_index(token: str = Query(...)):
+    """Opt out: delete the account's metadata index and browse Drive live again"""
+    if not redis_client.get_credentials_by_token(token):
+        return {"error": "Invalid token or session expired"}
+
+    if metadata_indexes.remove(token):
+        return {"message": "Metadata index deleted"}
+    return {"error": "No metadata index for this account"}
+
 @router.post("/transfer-file")
 def transfer_file(
     file_id: str = Query(...), 
     folder_id: str = Query(None), 
     delete_source: bool = Query(False),
     source_token: str = Query(...),
-    dest_token: str = Query(...)
+    dest_token: str = Query(...),
+    streaming: bool = Query(True, description="Pipe the download straight into the upload instead of buffering the whole file in memory"),
+    dedup: bool = Query(False, description="Skip the transfer if the target folder already has a file with the same md5 and size"),
+    transfer_id: Optional[str] = Query(None, description="Client-chosen ID to follow this transfer on /transfer-progress/{transfer_id}")
 ):
     source_credentials = redis_client.get_credentials_by_token(source_token)
     dest_credentials = redis_client.get_credentials_by_token(dest_token)
     
+    if not source_credentials or not dest_credentials:
+        return {"error": "Invalid tokens or sessions expired"}
+
+    if transfer_id:
+        # A retry reusing the ID must not be reported done from the last attempt
+        redis_client.clear_transfer_progress(transfer_id)
+
+    try:
+        result = transfer_drive_file(
+            source_credentials,
+            dest_credentials,
+            file_id,
+            folder_id=folder_id,
+            delete_source=delete_source,
+            streaming=streaming,
+            same_account=is_same_account(source_token, dest_token),
+            resume_key=transfer_checkpoint_key(dest_token, file_id, folder_id),
+            dedup=dedup,
+            progress_id=transfer_id
+        )
+        listing_cache.invalidate_transfer(source_token, dest_token, folder_id, delete_source)
+        return {
+            "message": result["message"],
+            "destFileId": result["destFileId"],
+            "serverSide": result["serverSide"],
+            "alreadyPresent": result["alreadyPresent"]
+        }
+    except Exception as e:
+        logger.error(f"Error in transfer_file: {e}")
+        return {"error": str(e)}
+    finally:
+        if transfer_id:
+            publish_transfer_done(transfer_id)
+
+class TransferBatchRequest(BaseModel):
+    file_ids: List[str]
+    source_token: str
+    dest_token: str
+    folder_id: Optional[str] = None
+    delete_source: bool = False
+    dedup: bool = False
+
+@router.post("/transfer-batch")
+def transfer_batch(batch: TransferBatchRequest):
+    """
+    Queue many file transfers as one job on the server-side worker pool.
+
+    Returns:
+    - jobId: Poll GET /transfer-jobs/{jobId} for per-file status
+    """
+    if not batch.file_ids:
+        return {"error": "No files to transfer"}
+
+    source_credentials = redis_client.get_credentials_by_token(batch.source_token)
+    dest_credentials = redis_client.get_credentials_by_token(batch.dest_token)
+
     if not source_credentials or not dest_credentials:
         return {"error": "Invalid tokens or sessions expired"}
 
     try:
-        source = build("drive", "v3", credentials=source_credentials)
-        dest = build("drive", "v3", credentials=dest_credentials)
-        meta = source.files().get(fileId=file_id, fields="name, mimeType").execute()
-
-        file_name = meta["name"]
-        mime_type = meta["mimeType"]
-
-        # Define export formats for Google Workspace files
-        export_types = {
-            "application/vnd.google-apps.document": "application/pdf",
-            "application/vnd.google-apps.spreadsheet": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            "application/vnd.google-apps.presentation": "application/pdf",
-            "application/vnd.google-apps.drawing": "image/png"
+        job_id = transfer_job_manager.submit_batch(
+            batch.file_ids,
+            batch.source_token,
+            batch.dest_token,
+            folder_id=batch.folder_id,
+            delete_source=batch.delete_source,
+            dedup=batch.dedup
+        )
+        return {
+            "jobId": job_id,
+            "totalFiles": len(set(batch.file_ids)),
+            "workers": transfer_job_manager.max_workers
         }
+    except Exception as e:
+        logger.error(f"Error in transfer_batch: {e}")
+        return {"error": str(e)}
 
-        fh = io.BytesIO()
-        
-        # Check if this is a Google Workspace file that needs to be exported
-        if mime_type in export_types:
-            export_mime_type = export_types[mime_type]
-            logger.info(f"Exporting Google Workspace file '{file_name}' from {mime_type} to {export_mime_type}")
-            
-            # Export the file in the appropriate format
-            request = source.files().export_media(fileId=file_id, mimeType=export_mime_type)
-            
-            # Update filename with appropriate extension
-            file_name += get_file_extension(export_mime_type)
-            
-            # Update mime type for upload
-            upload_mime_type = export_mime_type
-        else:
-            # Regular file download
-            logger.info(f"Downloading regular file '{file_name}' with mime type {mime_type}")
-            request = source.files().get_media(fileId=file_id)
-            upload_mime_type = mime_type
-
-        # Download/export the file
-        downloader = MediaIoBaseDownload(fh, request)
-        done = False
-        while not done:
-            status, done = downloader.next_chunk()
-        fh.seek(0)
-
-        # Prepare the upload
-        body = {"name": file_name}
-        if folder_id:
-            body["parents"] = [folder_id]
+@router.post("/transfer-folder")
+def transfer_folder(
+    folder_id: str = Query(..., description="ID of the source folder to mirror"),
+    source_token: str = Query(...),
+    dest_token: str = Query(...),
+    dest_folder_id: Optional[str] = Query(None, description="Destination folder to create the copy in (root if omitted)"),
+    dedup: bool = Query(False, description="Skip files the destination folder already has")
+):
+    """
+    Mirror a folder tree to the destination account as a transfer job.
 
-        # Upload to destination
-        media = MediaIoBaseUpload(fh, mimetype=upload_mime_type, resumable=True)
-        dest.files().create(body=body, media_body=media).execute()
+    The folder hierarchy is recreated at the destination and every file is
+    copied into its matching folder on the server-side worker pool.
+
+    Returns:
+    - jobId: Poll GET /transfer-jobs/{jobId} for folder and per-file status
+    """
+    source_credentials = redis_client.get_credentials_by_token(source_token)
+    dest_credentials = redis_client.get_credentials_by_token(dest_token)
 
-        if delete_source:
-            source.files().delete(fileId=file_id).execute()
+    if not source_credentials or not dest_credentials:
+        return {"error": "Invalid tokens or sessions expired"}
 
-        return {"message": f"✅ File '{file_name}' transferred successfully."}
+    try:
+        job_id = transfer_job_manager.submit_folder(
+            folder_id,
+            source_token,
+            dest_token,
+            dest_parent_id=dest_folder_id,
+            dedup=dedup
+        )
+        return {"jobId": job_id, "workers": transfer_job_manager.max_workers}
     except Exception as e:
-        logger.error(f"Error in transfer_file: {e}")
+        logger.error(f"Error in transfer_folder: {e}")
         return {"error": str(e)}
 
-def get_file_extension(mime_type):
-    """Get appropriate file extension for a given MIME type"""
-    ext_map = {
-        "application/pdf": ".pdf",
-        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet": ".xlsx",
-        "application/vnd.openxmlformats-officedocument.wordprocessingml.document": ".docx",
-        "application/vnd.openxmlformats-officedocument.presentationml.presentation": ".pptx",
-        "image/png": ".png",
-        "image/jpeg": ".jpg",
-        "text/plain": ".txt",
-        "text/csv": ".csv"
-    }
-    return ext_map.get(mime_type, "")
+@router.post("/sync")
+def sync_folder(
+    folder_id: str = Query(..., description="ID of the source folder to keep in sync"),
+    source_token: str = Query(...),
+    dest_token: str = Query(...),
+    dest_folder_id: Optional[str] = Query(None, description="Destination folder holding the copy (root if omitted)")
+):
+    """
+    Incrementally sync a folder tree to the destination account.
+
+    The first call mirrors the folder like /transfer-folder. Later calls
+    with the same accounts and folders only apply what changed in the
+    source since the previous run, using the Drive Changes API.
+
+    Returns:
+    - syncId: Identifies the stored checkpoint
+    - mode: "full" or "incremental"
+    - jobIds: Transfer jobs started by this run, for GET /transfer-jobs/{jobId}
+    """
+    source_credentials = redis_client.get_credentials_by_token(source_token)
+    dest_credentials = redis_client.get_credentials_by_token(dest_token)
+
+    if not source_credentials or not dest_credentials:
+        return {"error": "Invalid tokens or sessions expired"}
+
+    try:
+        return run_sync(source_credentials, dest_credentials, source_token, dest_token,
+                        folder_id, dest_folder_id)
+    except SyncBusy as e:
+        return {"error": str(e)}
+    except Exception as e:
+        logger.error(f"Error in sync_folder: {e}")
+        return {"error": str(e)}
+
+@router.get("/transfer-jobs/{job_id}")
+def get_transfer_job(job_id: str):
+    """Get the status of a batch transfer job and each of its files"""
+    job = transfer_job_manager.get_job(job_id)
+    if not job:
+        return {"error": "Transfer job not found or expired"}
+    return job
+
+@router.get("/transfer-progress/{transfer_id}")
+def transfer_progress(transfer_id: str):
+    """
+    Stream progress of a transfer or transfer job as Server-Sent Events.
+
+    `transfer_id` is either the transfer_id given to /transfer-file or a
+    job ID. Each event is a JSON object with a `type` of file_started,
+    progress, file_completed, file_failed or done; the stream ends after
+    the done event.
+    """
+    async def event_stream():
+        # Waiting happens on the event loop, so open streams do not tie up threadpool threads.
+        # Subscribe before reading the snapshot so no event falls in between
+        pubsub = await redis_client.subscribe_transfer_events(transfer_id)
+        try:
+            snapshot = await redis_client.get_transfer_progress(transfer_id)
+            for key, event in snapshot.items():
+                if key != "__done__":
+                    yield f"data: {json.dumps(event)}\n\n"
+            if "__done__" in snapshot:
+                yield f"data: {json.dumps(snapshot['__done__'])}\n\n"
+                return
+
+            while True:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=15)
+                if message is None:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"data: {message['data']}\n\n"
+                if json.loads(message["data"]).get("type") == "done":
+                    return
+        finally:
+            await pubsub.aclose()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 def format_file_size(size_bytes):
     """Format file size in bytes to human readable format"""
@@ -941,42 +1242,123 @@ def categorize_file_type(mime_type):
 # ----------------------------
 
 @router.post("/match-face")
-async def match_face(file: UploadFile = File(...), threshold: float = 0.6):
-    temp_path = "temp_uploaded.jpg"
-    with open(temp_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-
-    # Create known_faces.json if it doesn't exist
-    if not os.path.exists("known_faces.json"):
-        with open("known_faces.json", "w") as f:
-            json.dump([], f)
+async def match_face(file: UploadFile = File(...), threshold: float = 0.6,
+                     top_k: int = 1, nprobe: Optional[int] = None):
+    # Sizing the gallery may migrate or reload it from disk, so it runs off the event loop
+    loop = asyncio.get_running_loop()
+    if await loop.run_in_executor(None, len, face_gallery) == 0:
         return {"error": "No known faces to compare with. Please train the system first."}
 
-    with open("known_faces.json", "r") as f:
-        known_faces = json.load(f)
-
-    known_encodings = [np.array(face["encoding"]) for face in known_faces]
-    known_names = [face["name"] for face in known_faces]
-
-    image = face_recognition.load_image_file(temp_path)
-    new_encodings = face_recognition.face_encodings(image)
-
-    os.remove(temp_path)
+    # Detection and encoding run in the face worker processes, off the event loop
+    image_bytes = await file.read()
+    _, new_encodings = await face_workers.encode(image_bytes)
 
-    if not new_encodings:
+    if not len(new_encodings):
         return {"match": None, "message": "No face found in uploaded image."}
 
-    new_encoding = new_encodings[0]
-    distances = face_recognition.face_distance(known_encodings, new_encoding)
-    best_index = np.argmin(distances)
+    # Nearest known faces from the gallery's index; nprobe tunes IVF recall vs. latency
+    candidates = await loop.run_in_executor(
+        None, face_gallery.search, new_encodings[0], max(1, top_k), nprobe)
+    if not candidates:
+        return {"match": None, "message": "No match found."}
+    name, distance = candidates[0]
 
-    if distances[best_index] <= threshold:
-        return {
-            "match": known_names[best_index],
-            "distance": float(distances[best_index])
+    if distance <= threshold:
+        result = {
+            "match": name,
+            "distance": distance
         }
     else:
-        return {"match": None, "message": "No match found."}
+        result = {"match": None, "message": "No match found."}
+    if top_k > 1:
+        result["candidates"] = [{"name": name, "distance": distance} for name, distance in candidates]
+    return result
+
+def _download_drive_image(credentials, file_id: str) -> bytes:
+    """Fetch an image's bytes from Drive for face matching"""
+    service = get_drive_service(credentials)
+    return drive_scheduler.execute(service.files().get_media(fileId=file_id))
+
+@router.post("/match-faces/batch")
+async def match_faces_batch(
+    files: Optional[List[UploadFile]] = File(None),
+    file_ids: Optional[List[str]] = Query(None, description="Drive image IDs to match, read with `token`"),
+    token: Optional[str] = Query(None),
+    threshold: float = 0.6,
+    top_k: int = 1,
+    nprobe: Optional[int] = None
+):
+    """
+    Match every face in many images against the gallery in one call.
+
+    Images come as multipart uploads and/or Drive file IDs. All images are
+    encoded in parallel on the face worker processes, and all their faces
+    are then searched together in one batched distance computation.
+
+    Returns:
+    - images: Per image, each face's box (top/right/bottom/left pixels) and match
+    """
+    files = files or []
+    file_ids = file_ids or []
+    if not files and not file_ids:
+        return {"error": "No images to match"}
+    if len(files) + len(file_ids) > FACE_BATCH_MAX_IMAGES:
+        return {"error": f"At most {FACE_BATCH_MAX_IMAGES} images per batch"}
+    loop = asyncio.get_running_loop()
+    if await loop.run_in_executor(None, len, face_gallery) == 0:
+        return {"error": "No known faces to compare with. Please train the system first."}
+
+    credentials = None
+    if file_ids:
+        credentials = redis_client.get_credentials_by_token(token) if token else None
+        if not credentials:
+            return {"error": "Invalid token or session expired"}
+
+    images = [{"filename": f.filename} for f in files] + [{"fileId": file_id} for file_id in file_ids]
+
+    async def encode(position: int):
+        if position < len(files):
+            image_bytes = await files[position].read()
+        else:
+            image_bytes = await loop.run_in_executor(
+                None, _download_drive_image, credentials, file_ids[position - len(files)])
+        return await face_workers.encode(image_bytes)
+
+    # Downloads and encodings of all images overlap; one bad image does not fail the batch
+    encoded = await asyncio.gather(*[encode(i) for i in range(len(images))], return_exceptions=True)
+
+    all_encodings = []
+    for image, result in zip(images, encoded):
+        if isinstance(result, BaseException):
+            # gather also hands back cancellations (e.g. a cancelled download) as results
+            logger.error(f"Error encoding image {image}: {result!r}")
+            image["error"] = str(result)
+            image["faces"] = []
+            continue
+        locations, encodings = result
+        image["faces"] = [{"box": dict(zip(("top", "right", "bottom", "left"), location))}
+                          for location in locations]
+        all_encodings.extend(encodings)
+
+    candidates = await loop.run_in_executor(
+        None, face_gallery.search_batch, np.array(all_encodings, dtype=np.float32), max(1, top_k), nprobe)
+
+    faces = (face for image in images for face in image["faces"])
+    for face, face_candidates in zip(faces, candidates):
+        if not face_candidates:
+            face["match"], face["distance"] = None, None
+            continue
+        name, distance = face_candidates[0]
+        face["match"] = name if distance <= threshold else None
+        face["distance"] = distance
+        if top_k > 1:
+            face["candidates"] = [{"name": name, "distance": distance} for name, distance in face_candidates]
+
+    return {
+        "images": images,
+        "totalImages": len(images),
+        "totalFaces": len(candidates)
+    }
 
 @router.get("/search-images")
 def search_images(name: str):
@@ -1,5 +1,6 @@
 # backend/app/config.py
 import os
+import tempfile
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -19,3 +20,66 @@ REDIS_PORT = int(os.getenv('REDIS_PORT', 6379))
 REDIS_DB = int(os.getenv('REDIS_DB', 0))
 REDIS_PASSWORD = os.getenv('REDIS_PASSWORD', None)
 
+# Enrolled faces used by /match-face: <path>.f32 encodings plus a <path>.names sidecar
+FACE_GALLERY_PATH = os.getenv('FACE_GALLERY_PATH', str(BASE_DIR / "face_gallery"))
+# Legacy JSON gallery, migrated into FACE_GALLERY_PATH on first load
+KNOWN_FACES_PATH = os.getenv('KNOWN_FACES_PATH', str(BASE_DIR / "known_faces.json"))
+# Galleries with at least this many faces are searched through an IVF index (0 keeps brute force)
+FACE_INDEX_MIN_SIZE = int(os.getenv('FACE_INDEX_MIN_SIZE', 50000))
+# IVF lists (0 = square root of the gallery size)
+FACE_INDEX_LISTS = int(os.getenv('FACE_INDEX_LISTS', 0))
+# IVF lists scanned per query by default; higher raises recall and latency
+FACE_INDEX_NPROBE = int(os.getenv('FACE_INDEX_NPROBE', 8))
+# Processes that detect and encode faces, per web worker (0 = the CPU cores shared among WEB_CONCURRENCY)
+FACE_WORKERS = int(os.getenv('FACE_WORKERS', 0))
+# uvicorn/gunicorn web worker processes on this machine; each starts its own face pool
+WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', 1))
+# Images accepted by one /match-faces/batch call
+FACE_BATCH_MAX_IMAGES = int(os.getenv('FACE_BATCH_MAX_IMAGES', 200))
+
+
+# Transfer Configuration
+# Chunk size for Drive downloads/uploads; resumable uploads need a multiple of 256 KB
+TRANSFER_CHUNK_SIZE = int(os.getenv('TRANSFER_CHUNK_SIZE', 8 * 1024 * 1024))
+# Number of chunks the streaming ring buffer holds between download and upload
+STREAM_BUFFER_CHUNKS = int(os.getenv('STREAM_BUFFER_CHUNKS', 4))
+# Number of files a batch transfer job moves concurrently
+TRANSFER_WORKERS = int(os.getenv('TRANSFER_WORKERS', 4))
+# Number of folders a folder mirror job lists or creates concurrently
+FOLDER_MIRROR_WORKERS = int(os.getenv('FOLDER_MIRROR_WORKERS', 4))
+# Number of folders /list-folder-contents-recursive lists concurrently
+FOLDER_SCAN_WORKERS = int(os.getenv('FOLDER_SCAN_WORKERS', 8))
+# Number of folders packed into one `in parents` query by the recursive scan
+FOLDER_SCAN_BATCH_SIZE = int(os.getenv('FOLDER_SCAN_BATCH_SIZE', 20))
+# Binary files at least this large are downloaded over several connections
+PARALLEL_DOWNLOAD_THRESHOLD = int(os.getenv('PARALLEL_DOWNLOAD_THRESHOLD', 64 * 1024 * 1024))
+PARALLEL_DOWNLOAD_CONNECTIONS = int(os.getenv('PARALLEL_DOWNLOAD_CONNECTIONS', 4))
+PARALLEL_DOWNLOAD_CHUNK_SIZE = int(os.getenv('PARALLEL_DOWNLOAD_CHUNK_SIZE', TRANSFER_CHUNK_SIZE))
+# Disk cache for Google Workspace exports; a size of 0 disables it
+EXPORT_CACHE_DIR = os.getenv('EXPORT_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'cloudmover-export-cache'))
+EXPORT_CACHE_MAX_BYTES = int(os.getenv('EXPORT_CACHE_MAX_BYTES', 1024 * 1024 * 1024))
+# Seconds listing responses stay cached in Redis; 0 disables the cache
+LISTING_CACHE_TTL = int(os.getenv('LISTING_CACHE_TTL', 30))
+# Folder name/parent cache used to build breadcrumbs
+FOLDER_CACHE_SIZE = int(os.getenv('FOLDER_CACHE_SIZE', 100000))
+FOLDER_CACHE_TTL = int(os.getenv('FOLDER_CACHE_TTL', 600))
+# Opt-in per-account SQLite metadata indexes served to the browsing endpoints
+METADATA_INDEX_DIR = os.getenv('METADATA_INDEX_DIR', os.path.join(tempfile.gettempdir(), 'cloudmover-metadata-index'))
+# Minimum seconds between Changes API refreshes of an index
+METADATA_INDEX_REFRESH_INTERVAL = float(os.getenv('METADATA_INDEX_REFRESH_INTERVAL', 30))
+# Seconds an incremental sync checkpoint is kept without a new run
+SYNC_STATE_TTL = int(os.getenv('SYNC_STATE_TTL', 30 * 86400))
+# Minimum seconds between progress events published for one file
+PROGRESS_INTERVAL = float(os.getenv('PROGRESS_INTERVAL', 0.5))
+# Seconds a destination folder's checksum index is reused by dedup transfers
+DEDUP_INDEX_TTL = int(os.getenv('DEDUP_INDEX_TTL', 3600))
+
+# Drive service objects reused per thread and account
+DRIVE_SERVICE_CACHE_SIZE = int(os.getenv('DRIVE_SERVICE_CACHE_SIZE', 64))
+DRIVE_SERVICE_CACHE_TTL = int(os.getenv('DRIVE_SERVICE_CACHE_TTL', 300))
+
+# Drive API rate limiting (requests per second per account)
+DRIVE_RATE_LIMIT = float(os.getenv('DRIVE_RATE_LIMIT', 10))
+DRIVE_RATE_MAX = float(os.getenv('DRIVE_RATE_MAX', 20))
+DRIVE_RATE_BURST = int(os.getenv('DRIVE_RATE_BURST', 20))
+DRIVE_MAX_RETRIES = int(os.getenv('DRIVE_MAX_RETRIES', 6))
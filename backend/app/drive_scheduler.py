@@ -0,0 +1,130 @@
+import json
+import random
+import threading
+import time
+import logging
+from typing import Callable
+from cachetools import LRUCache
+from googleapiclient.errors import HttpError
+from app.config import DRIVE_RATE_LIMIT, DRIVE_RATE_MAX, DRIVE_RATE_BURST, DRIVE_MAX_RETRIES
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_REASONS = {"userRateLimitExceeded", "rateLimitExceeded"}
+
+
+class TokenBucket:
+    """
+    Blocking token bucket whose refill rate adapts to throttling.
+
+    The rate is halved on every throttled response and grows back slowly
+    with successful calls (AIMD), so it settles just under the rate Drive
+    is willing to serve.
+    """
+
+    def __init__(self, rate: float, max_rate: float, burst: int, min_rate: float = 0.5):
+        self.rate = rate
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """Take one token, sleeping until one is available"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def throttle(self):
+        """Back off after a rate-limit response"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._tokens = min(self._tokens, 0)
+
+    def reward(self):
+        """Creep back up after a successful call"""
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + 0.1)
+
+
+def is_rate_limited(error: HttpError) -> bool:
+    """Check whether Drive rejected a call because of its rate limits"""
+    status = error.resp.status
+    if status == 429:
+        return True
+    if status != 403:
+        return False
+    try:
+        content = error.content.decode("utf-8") if isinstance(error.content, bytes) else error.content
+        errors = json.loads(content).get("error", {}).get("errors", [])
+        return any(e.get("reason") in RATE_LIMIT_REASONS for e in errors)
+    except (ValueError, AttributeError):
+        return False
+
+
+class DriveScheduler:
+    """
+    Shared gate for every Drive API call.
+
+    Keeps one token bucket per account, keyed by the credentials token
+    the request is authorized with, and retries throttled calls with
+    jittered exponential backoff.
+    """
+
+    def __init__(self, rate: float = DRIVE_RATE_LIMIT, max_rate: float = DRIVE_RATE_MAX,
+                 burst: int = DRIVE_RATE_BURST, max_retries: int = DRIVE_MAX_RETRIES):
+        self.rate = rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self._buckets = LRUCache(maxsize=1024)
+        self._lock = threading.Lock()
+
+    def _bucket(self, request) -> TokenBucket:
+        credentials = getattr(request.http, "credentials", None)
+        key = getattr(credentials, "token", None) or "anonymous"
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = TokenBucket(self.rate, self.max_rate, self.burst)
+                self._buckets[key] = bucket
+            return bucket
+
+    def call(self, request, fn: Callable, *args, **kwargs):
+        """Run `fn` (a step of `request`, e.g. next_chunk) under the account's rate limit"""
+        bucket = self._bucket(request)
+        for attempt in range(self.max_retries + 1):
+            bucket.acquire()
+            try:
+                result = fn(*args, **kwargs)
+                bucket.reward()
+                return result
+            except HttpError as e:
+                if not is_rate_limited(e) or attempt == self.max_retries:
+                    raise
+                bucket.throttle()
+                delay = min(64, 2 ** attempt) * random.uniform(0.5, 1.5)
+                logger.warning(f"Drive rate limit hit ({e.resp.status}), retrying in {delay:.1f}s "
+                               f"at {bucket.rate:.1f} req/s")
+                time.sleep(delay)
+
+    def execute(self, request, **kwargs):
+        """Execute a Drive API request under the account's rate limit"""
+        return self.call(request, request.execute, **kwargs)
+
+
+# Shared scheduler for all Drive API calls
+drive_scheduler = DriveScheduler()
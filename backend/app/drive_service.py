@@ -0,0 +1,59 @@
+import json
+import threading
+from cachetools import TTLCache
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.http import build_http
+from app.config import DRIVE_SERVICE_CACHE_SIZE, DRIVE_SERVICE_CACHE_TTL
+
+# Drive v3 discovery document bundled with google-api-python-client, parsed once
+DRIVE_DISCOVERY_DOC = json.loads(get_static_doc("drive", "v3"))
+
+
+class DriveServiceCache:
+    """
+    Reuses Drive service objects across requests.
+
+    Services are keyed by access token, so each account keeps its
+    authorized HTTP connection alive between calls. httplib2 connections
+    are not thread-safe, so every thread (FastAPI's threadpool, transfer
+    workers) has its own TTL/LRU cache.
+    """
+
+    def __init__(self, maxsize: int = DRIVE_SERVICE_CACHE_SIZE, ttl: float = DRIVE_SERVICE_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._local = threading.local()
+
+    def _cache(self) -> TTLCache:
+        cache = getattr(self._local, "cache", None)
+        if cache is None:
+            cache = self._local.cache = TTLCache(maxsize=self.maxsize, ttl=self.ttl)
+        return cache
+
+    @staticmethod
+    def build(credentials):
+        """Build a Drive service from the bundled discovery document"""
+        http = AuthorizedHttp(credentials, http=build_http())
+        return build_from_document(DRIVE_DISCOVERY_DOC, http=http)
+
+    def get(self, credentials):
+        key = getattr(credentials, "token", None)
+        if not key:
+            return self.build(credentials)
+
+        cache = self._cache()
+        service = cache.get(key)
+        if service is None:
+            service = cache[key] = self.build(credentials)
+        return service
+
+
+# Shared per-thread service cache
+drive_services = DriveServiceCache()
+
+
+def get_drive_service(credentials):
+    """Drive v3 service for `credentials`, reused within the current thread"""
+    return drive_services.get(credentials)
@@ -0,0 +1,172 @@
+import os
+import hashlib
+import logging
+import tempfile
+import threading
+import time
+from typing import Optional, Callable
+from app.config import EXPORT_CACHE_DIR, EXPORT_CACHE_MAX_BYTES, TRANSFER_CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+# A .part file not written for this long belongs to an export whose process died
+STALE_PART_SECONDS = 3600
+
+
+class ExportCacheWriter:
+    """Collects one export into a temporary file and publishes it on commit"""
+
+    def __init__(self, cache: "ExportCache", key: str):
+        self._cache = cache
+        self._key = key
+        fd, self._tmp_path = tempfile.mkstemp(dir=cache.directory, suffix=".part")
+        self._file = os.fdopen(fd, "wb")
+
+    def write(self, data) -> int:
+        return self._file.write(data)
+
+    def commit(self):
+        self._file.close()
+        os.replace(self._tmp_path, self._cache.path(self._key))
+        self._cache.evict()
+
+    def discard(self):
+        self._file.close()
+        try:
+            os.remove(self._tmp_path)
+        except FileNotFoundError:
+            pass
+
+
+class ExportCache:
+    """
+    Disk cache for Google Workspace exports.
+
+    Entries are keyed by file ID, file version and export MIME type, so an
+    edited document simply misses. The directory is the index: reads bump
+    an entry's mtime and eviction removes the least recently used files
+    until the cache fits in `max_bytes`, which keeps several uvicorn
+    workers sharing one directory consistent. Exports in progress count
+    towards the cap, and ones abandoned by a crash are swept away.
+    """
+
+    def __init__(self, directory: str = EXPORT_CACHE_DIR, max_bytes: int = EXPORT_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        if self.enabled:
+            os.makedirs(directory, exist_ok=True)
+            self.evict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @staticmethod
+    def key(file_id: str, version: str, mime_type: str) -> str:
+        return hashlib.sha256(f"{file_id}:{version}:{mime_type}".encode("utf-8")).hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.export")
+
+    def open(self, key: str):
+        """Open a cached export for reading, or return None on a miss"""
+        if not self.enabled:
+            return None
+        path = self.path(key)
+        try:
+            fh = open(path, "rb")
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass  # Evicted by another worker; the open handle still reads it
+        return fh
+
+    def writer(self, key: str) -> Optional[ExportCacheWriter]:
+        return ExportCacheWriter(self, key) if self.enabled else None
+
+    def evict(self):
+        """Drop stale partial exports, then least recently used exports until the cache fits its size cap"""
+        with self._lock:
+            entries = []
+            total = 0
+            stale_before = time.time() - STALE_PART_SECONDS
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if not entry.name.endswith((".export", ".part")):
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    if entry.name.endswith(".part"):
+                        if stat.st_mtime < stale_before:
+                            try:
+                                os.remove(entry.path)
+                                logger.info(f"Removed abandoned partial export {entry.name}")
+                            except FileNotFoundError:
+                                pass
+                        else:
+                            total += stat.st_size  # Still being written; counts but cannot be evicted
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    logger.info(f"Evicted cached export {os.path.basename(path)}")
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+
+def cached_file_download(fh, chunk_size: int = TRANSFER_CHUNK_SIZE) -> Callable:
+    """Download function that streams a cached export into a RingBuffer"""
+    def download(buffer, start_offset: int = 0):
+        with fh:
+            fh.seek(start_offset)
+            while True:
+                data = fh.read(chunk_size)
+                if not data:
+                    break
+                buffer.write(data)
+
+    return download
+
+
+class _TeeBuffer:
+    """Forwards writes to the transfer buffer and to the export cache"""
+
+    def __init__(self, buffer, writer: ExportCacheWriter):
+        self._buffer = buffer
+        self._writer = writer
+
+    def write(self, data) -> int:
+        self._writer.write(data)
+        return self._buffer.write(data)
+
+
+def caching_download(download: Callable, writer: Optional[ExportCacheWriter]) -> Callable:
+    """Wrap a download function so a complete export is also stored in the cache"""
+    if writer is None:
+        return download
+
+    def tee(buffer, start_offset: int = 0):
+        try:
+            download(_TeeBuffer(buffer, writer), start_offset)
+        except BaseException:
+            writer.discard()
+            raise
+        writer.commit()
+
+    return tee
+
+
+# Shared cache for Workspace exports
+export_cache = ExportCache()
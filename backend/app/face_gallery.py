@@ -0,0 +1,270 @@
+import os
+import json
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Optional, List, Tuple
+import numpy as np
+from app.config import FACE_GALLERY_PATH, KNOWN_FACES_PATH
+from app.face_index import build_face_index, needs_rebuild
+
+logger = logging.getLogger(__name__)
+
+ENCODING_SIZE = 128
+ROW_BYTES = ENCODING_SIZE * np.dtype(np.float32).itemsize
+
+
+class FaceGallery:
+    """
+    Known faces kept resident in the process.
+
+    On disk the gallery is two append-only files: `<path>.f32` holds the
+    encodings as raw float32 rows of 128 values and `<path>.names` holds a
+    JSON line per row with its index and name. Enrolling a face appends one
+    row and one line, and loading memory-maps the rows instead of parsing
+    them. The map is refreshed when either file changes, so faces enrolled
+    by another process are picked up without a restart. A legacy
+    known_faces.json is migrated on first load.
+
+    Searches go through a face index (see app.face_index) that is built
+    lazily and extended with appended rows rather than rebuilt. Extending
+    swaps in a new index, so searches never see one half-updated.
+    """
+
+    def __init__(self, path: str = FACE_GALLERY_PATH, legacy_path: Optional[str] = KNOWN_FACES_PATH):
+        self.path = path
+        self.legacy_path = legacy_path
+        self.vectors_path = f"{path}.f32"
+        self.names_path = f"{path}.names"
+        self._lock = threading.Lock()
+        self._signature = None
+        # (encodings, names) replaced as one object, so readers never pair rows and names of different loads
+        self._snapshot: Tuple[np.ndarray, List[str]] = (np.empty((0, ENCODING_SIZE), dtype=np.float32), [])
+        self._read_names_list: List[str] = []
+        self._names_offset = 0
+        self._migrated = False
+        self._index = None
+        self._index_lock = threading.Lock()
+
+    @contextmanager
+    def _file_lock(self):
+        """Serialize writers across processes"""
+        with open(f"{self.path}.lock", "a+") as lock_file:
+            if os.name == "nt":
+                import msvcrt
+                lock_file.seek(0)
+                while True:
+                    try:
+                        # LK_LOCK gives up after ten one-second retries
+                        msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        continue
+                try:
+                    yield
+                finally:
+                    lock_file.seek(0)
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _file_signature(self) -> Optional[Tuple]:
+        try:
+            vectors = os.stat(self.vectors_path)
+            names = os.stat(self.names_path)
+        except FileNotFoundError:
+            return None
+        return vectors.st_ino, vectors.st_size, names.st_ino, names.st_size, names.st_mtime_ns
+
+    def _migrate_legacy(self):
+        """Convert a known_faces.json gallery into the binary files once"""
+        self._migrated = True
+        if not self.legacy_path or not os.path.exists(self.legacy_path):
+            return
+        with self._file_lock():
+            if os.path.exists(self.vectors_path):
+                return  # Another process migrated first
+            with open(self.legacy_path, "r") as f:
+                known_faces = json.load(f)
+            encodings = np.array([face["encoding"] for face in known_faces], dtype=np.float32)
+            with open(f"{self.names_path}.tmp", "w") as f:
+                f.writelines(json.dumps({"id": i, "name": face["name"]}) + "\n"
+                             for i, face in enumerate(known_faces))
+            with open(f"{self.vectors_path}.tmp", "wb") as f:
+                f.write(encodings.reshape(-1, ENCODING_SIZE).tobytes())
+            os.replace(f"{self.names_path}.tmp", self.names_path)
+            # The vectors file appearing marks the migration as done
+            os.replace(f"{self.vectors_path}.tmp", self.vectors_path)
+            os.replace(self.legacy_path, f"{self.legacy_path}.migrated")
+        logger.info(f"Migrated {len(known_faces)} faces from {self.legacy_path} to {self.vectors_path}")
+
+    def _read_names(self, reset: bool) -> List[str]:
+        """Read names appended since the last load, or all of them after `reset`"""
+        names = [] if reset else self._read_names_list
+        offset = 0 if reset else self._names_offset
+        with open(self.names_path, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # Append still in progress
+                names.append(json.loads(line)["name"])
+                offset += len(line)
+        self._names_offset = offset
+        self._read_names_list = names
+        return names
+
+    def _load(self, signature):
+        reset = (self._signature is None or signature[0] != self._signature[0]
+                 or signature[2] != self._signature[2] or signature[3] < self._names_offset)
+        if reset:
+            self._index = None  # Rows were rewritten, not appended
+        names = self._read_names(reset)
+        # Rows and names are appended separately; only pairs present in both count
+        count = min(signature[1] // ROW_BYTES, len(names))
+        if count:
+            encodings = np.memmap(self.vectors_path, dtype=np.float32, mode="r",
+                                  shape=(count, ENCODING_SIZE))
+        else:
+            encodings = np.empty((0, ENCODING_SIZE), dtype=np.float32)
+        return encodings, names[:count]
+
+    def snapshot(self) -> Tuple[np.ndarray, List[str]]:
+        """Current (encodings, names), reloaded first if the files changed"""
+        if not self._migrated:
+            self._migrate_legacy()
+        signature = self._file_signature()
+        if signature != self._signature:
+            with self._lock:
+                if signature != self._signature:
+                    if signature is None:
+                        self._snapshot = (np.empty((0, ENCODING_SIZE), dtype=np.float32), [])
+                        self._read_names_list, self._names_offset = [], 0
+                        self._index = None
+                    else:
+                        self._snapshot = self._load(signature)
+                    self._signature = signature
+        return self._snapshot
+
+    def __len__(self) -> int:
+        return len(self.snapshot()[1])
+
+    def add(self, name: str, encoding):
+        """Enroll one face by appending a row and a name"""
+        row = np.asarray(encoding, dtype=np.float32).reshape(ENCODING_SIZE)
+        if not self._migrated:
+            self._migrate_legacy()
+        with self._file_lock():
+            self._drop_orphaned_names()
+            with open(self.vectors_path, "ab") as vectors, open(self.names_path, "a+b") as names:
+                # Drop the half of an append that was interrupted before both files were written
+                count, valid_bytes = self._tail_entries(names)
+                count = min(os.fstat(vectors.fileno()).st_size // ROW_BYTES, count)
+                names.truncate(valid_bytes)
+                vectors.truncate(count * ROW_BYTES)
+
+                vectors.write(row.tobytes())
+                vectors.flush()
+                names.write((json.dumps({"id": count, "name": name}) + "\n").encode("utf-8"))
+
+    @staticmethod
+    def _tail_entries(names) -> Tuple[int, int]:
+        """(entries, bytes) up to the last complete line, read from the end of the file"""
+        size = names.seek(0, os.SEEK_END)
+        window = 4096
+        while True:
+            start = max(0, size - window)
+            names.seek(start)
+            tail = names.read(size - start)
+            end = tail.rfind(b"\n")
+            previous = tail.rfind(b"\n", 0, end) if end > 0 else -1
+            if previous >= 0 or start == 0:
+                if end < 0:
+                    return 0, 0
+                last = json.loads(tail[previous + 1:end + 1])
+                return last["id"] + 1, start + end + 1
+            window *= 2
+
+    def _drop_orphaned_names(self):
+        """
+        Rewrite the names file without the lines whose rows are missing from
+        the vectors file. Readers only re-read names from the start when the
+        file is replaced, so the repair swaps in a new file instead of
+        truncating and appending to the one they have read.
+        """
+        try:
+            rows = os.path.getsize(self.vectors_path) // ROW_BYTES
+        except FileNotFoundError:
+            rows = 0
+        try:
+            with open(self.names_path, "rb") as names:
+                count, _ = self._tail_entries(names)
+                if count <= rows:
+                    return
+                names.seek(0)
+                kept = b"".join(names.readline() for _ in range(rows))
+        except FileNotFoundError:
+            return
+        with open(f"{self.names_path}.tmp", "wb") as f:
+            f.write(kept)
+        os.replace(f"{self.names_path}.tmp", self.names_path)
+        logger.warning(f"Dropped {count - rows} face names without encodings from {self.names_path}")
+
+    def _current_index(self, encodings: np.ndarray):
+        with self._index_lock:
+            index = self._index
+            if index is None or index.size > len(encodings) or needs_rebuild(index, len(encodings)):
+                index = build_face_index(encodings)
+            elif index.size < len(encodings):
+                # Copy-on-write: searches already holding the old index keep a consistent view
+                index = index.add(encodings)
+            self._index = index
+            return index
+
+    def search(self, encoding, top_k: int = 1, nprobe: Optional[int] = None) -> List[Tuple[str, float]]:
+        """
+        The `top_k` known faces closest to `encoding` as (name, distance), nearest first.
+
+        `nprobe` sets how many lists an IVF index scans (more is slower but
+        finds more true neighbours); brute force always scans everything.
+        """
+        encodings, names = self.snapshot()
+        if not names:
+            return []
+        index = self._current_index(encodings)
+        nearest, distances = index.search(np.asarray(encoding, dtype=np.float32), top_k, nprobe)
+        return [(names[i], float(distance)) for i, distance in zip(nearest, distances)]
+
+    def search_batch(self, encodings, top_k: int = 1,
+                     nprobe: Optional[int] = None) -> List[List[Tuple[str, float]]]:
+        """search() for every row of `encodings` with one batched index lookup"""
+        known, names = self.snapshot()
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        if not names or not len(encodings):
+            return [[] for _ in range(len(encodings))]
+        index = self._current_index(known)
+        return [[(names[i], float(distance)) for i, distance in zip(nearest, distances)]
+                for nearest, distances in index.search_batch(encodings, top_k, nprobe)]
+
+    def match(self, encoding, threshold: float = 0.6,
+              nprobe: Optional[int] = None) -> Tuple[Optional[str], Optional[float]]:
+        """
+        Closest known face to `encoding`.
+
+        Returns (name, distance) when the distance is within `threshold`,
+        (None, distance) when it is not and (None, None) for an empty gallery.
+        """
+        results = self.search(encoding, 1, nprobe)
+        if not results:
+            return None, None
+        name, distance = results[0]
+        if distance <= threshold:
+            return name, distance
+        return None, distance
+
+# Shared gallery of known faces
+face_gallery = FaceGallery()
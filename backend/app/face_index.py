@@ -0,0 +1,245 @@
+import copy
+import logging
+from typing import Optional, List, Tuple
+import numpy as np
+from app.config import FACE_INDEX_MIN_SIZE, FACE_INDEX_LISTS, FACE_INDEX_NPROBE
+
+logger = logging.getLogger(__name__)
+
+# Rows handled per matrix product when assigning encodings to lists
+ASSIGN_CHUNK = 8192
+# k-means trains on at most this many sampled rows per list
+TRAIN_POINTS_PER_LIST = 64
+KMEANS_ITERATIONS = 10
+# Distances computed per matrix product in a brute-force batch search
+BATCH_DISTANCE_ELEMENTS = 16 * 1024 * 1024
+
+
+def _top_k(distances: np.ndarray, top_k: int) -> np.ndarray:
+    """Positions of the `top_k` smallest distances, nearest first"""
+    top_k = min(top_k, len(distances))
+    if top_k <= 0:
+        return np.empty(0, dtype=np.int64)
+    nearest = np.argpartition(distances, top_k - 1)[:top_k]
+    return nearest[np.argsort(distances[nearest])]
+
+
+def _nearest_centroid(points: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the closest centroid for every row of `points`"""
+    centroid_norms = np.einsum("ij,ij->i", centroids, centroids)
+    assignments = np.empty(len(points), dtype=np.int64)
+    for start in range(0, len(points), ASSIGN_CHUNK):
+        chunk = np.asarray(points[start:start + ASSIGN_CHUNK], dtype=np.float32)
+        # |x - c|^2 without the |x|^2 term, which does not change the argmin
+        assignments[start:start + len(chunk)] = np.argmin(centroid_norms - 2 * chunk @ centroids.T, axis=1)
+    return assignments
+
+
+def _squared_norms(rows: np.ndarray) -> np.ndarray:
+    norms = np.empty(len(rows), dtype=np.float32)
+    for start in range(0, len(rows), ASSIGN_CHUNK):
+        chunk = np.asarray(rows[start:start + ASSIGN_CHUNK], dtype=np.float32)
+        norms[start:start + len(chunk)] = np.einsum("ij,ij->i", chunk, chunk)
+    return norms
+
+
+def _kmeans(points: np.ndarray, k: int, iterations: int, rng) -> np.ndarray:
+    centroids = points[rng.choice(len(points), k, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = _nearest_centroid(points, centroids)
+        counts = np.bincount(assignments, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, points)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+        # Restart empty lists from random points so every list stays useful
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            centroids[empty] = points[rng.choice(len(points), len(empty), replace=False)]
+    return centroids
+
+
+class BruteForceIndex:
+    """Exact search: one distance per known face"""
+
+    def __init__(self, encodings: np.ndarray):
+        self.encodings = encodings
+        self.norms = _squared_norms(encodings)
+
+    @property
+    def size(self) -> int:
+        return len(self.norms)
+
+    def add(self, encodings: np.ndarray) -> "BruteForceIndex":
+        """A copy over the grown gallery; this index is left as is for searches in flight"""
+        grown = copy.copy(self)
+        grown.encodings = encodings
+        grown.norms = np.concatenate([self.norms, _squared_norms(encodings[self.size:])])
+        return grown
+
+    def search(self, encoding: np.ndarray, top_k: int = 1,
+               nprobe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        distances = np.linalg.norm(self.encodings - encoding, axis=1)
+        nearest = _top_k(distances, top_k)
+        return nearest, distances[nearest]
+
+    def search_batch(self, encodings: np.ndarray, top_k: int = 1,
+                     nprobe: Optional[int] = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """search() for many queries, as matrix products over blocks of queries"""
+        results = []
+        top_k = min(top_k, self.size)
+        rows = max(1, BATCH_DISTANCE_ELEMENTS // max(1, self.size))
+        for start in range(0, len(encodings), rows):
+            block = encodings[start:start + rows]
+            # |q - x|^2 = |q|^2 - 2 q.x + |x|^2 for every query/face pair at once
+            squared = (np.einsum("ij,ij->i", block, block)[:, None]
+                       - 2 * (block @ self.encodings.T) + self.norms[None, :])
+            distances = np.sqrt(np.maximum(squared, 0))
+            nearest = np.argpartition(distances, top_k - 1, axis=1)[:, :top_k]
+            nearest_distances = np.take_along_axis(distances, nearest, axis=1)
+            order = np.argsort(nearest_distances, axis=1)
+            nearest = np.take_along_axis(nearest, order, axis=1)
+            nearest_distances = np.take_along_axis(nearest_distances, order, axis=1)
+            results.extend(zip(nearest, nearest_distances))
+        return results
+
+
+class IVFIndex:
+    """
+    Inverted-file index for large galleries.
+
+    k-means splits the gallery into `nlist` lists around centroids; a query
+    only computes exact distances for the faces in the `nprobe` lists whose
+    centroids are closest (more when those hold fewer than `top_k` faces).
+    Raising nprobe trades latency for recall, and nprobe >= nlist is an
+    exact search. Appended faces join the list of their nearest centroid
+    without retraining, in a copy of the index.
+    """
+
+    def __init__(self, encodings: np.ndarray, nlist: int = FACE_INDEX_LISTS, seed: int = 0):
+        n = len(encodings)
+        self.nlist = min(n, nlist or max(1, int(np.sqrt(n))))
+        self.trained_size = n
+        rng = np.random.default_rng(seed)
+        sample_size = min(n, self.nlist * TRAIN_POINTS_PER_LIST)
+        sample = np.asarray(encodings[np.sort(rng.choice(n, sample_size, replace=False))], dtype=np.float32)
+        self.centroids = _kmeans(sample, self.nlist, KMEANS_ITERATIONS, rng)
+
+        self.encodings = encodings
+        self.norms = np.empty(0, dtype=np.float32)
+        self.lists: List[np.ndarray] = [np.empty(0, dtype=np.int64) for _ in range(self.nlist)]
+        self.list_sizes = np.zeros(self.nlist, dtype=np.int64)
+        self._assign(0)
+
+    @property
+    def size(self) -> int:
+        return len(self.norms)
+
+    def _assign(self, start: int):
+        """File rows from `start` onwards into their lists"""
+        new_rows = np.asarray(self.encodings[start:], dtype=np.float32)
+        self.norms = np.concatenate([self.norms, _squared_norms(new_rows)])
+        assignments = _nearest_centroid(new_rows, self.centroids)
+        self.list_sizes = self.list_sizes + np.bincount(assignments, minlength=self.nlist)
+        order = np.argsort(assignments, kind="stable")
+        bounds = np.searchsorted(assignments[order], np.arange(self.nlist + 1))
+        for list_id in np.flatnonzero(np.diff(bounds)):
+            rows = order[bounds[list_id]:bounds[list_id + 1]] + start
+            self.lists[list_id] = np.concatenate([self.lists[list_id], rows])
+
+    def add(self, encodings: np.ndarray) -> "IVFIndex":
+        """A copy with the appended rows filed; this index is left as is for searches in flight"""
+        grown = copy.copy(self)
+        grown.encodings = encodings
+        grown.lists = list(self.lists)
+        grown._assign(self.size)
+        return grown
+
+    def _probe(self, centroid_distances: np.ndarray, nprobe: Optional[int], top_k: int) -> np.ndarray:
+        """
+        The `nprobe` lists closest to a query, widened to further lists
+        until they hold at least `top_k` faces so a search never comes back empty
+        """
+        nprobe = min(self.nlist, max(1, nprobe or FACE_INDEX_NPROBE))
+        wanted = min(max(1, top_k), self.size)
+        probed = np.argpartition(centroid_distances, nprobe - 1)[:nprobe]
+        if self.list_sizes[probed].sum() >= wanted:
+            return probed
+        order = np.argsort(centroid_distances)
+        needed = int(np.searchsorted(np.cumsum(self.list_sizes[order]), wanted)) + 1
+        return order[:max(nprobe, needed)]
+
+    def search(self, encoding: np.ndarray, top_k: int = 1,
+               nprobe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        centroid_distances = np.einsum("ij,ij->i", self.centroids - encoding, self.centroids - encoding)
+        probed = self._probe(centroid_distances, nprobe, top_k)
+        # Sorted candidates read the memory-mapped rows in file order
+        candidates = np.sort(np.concatenate([self.lists[list_id] for list_id in probed]))
+        squared = self.norms[candidates] - 2 * (self.encodings[candidates] @ encoding) + encoding @ encoding
+        distances = np.sqrt(np.maximum(squared, 0))
+        nearest = _top_k(distances, top_k)
+        return candidates[nearest], distances[nearest]
+
+    def search_batch(self, encodings: np.ndarray, top_k: int = 1,
+                     nprobe: Optional[int] = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        search() for many queries. Queries are grouped by the lists they
+        probe, so each list costs one matrix product for all of its queries.
+        """
+        top_k = max(1, top_k)
+        encodings = np.asarray(encodings, dtype=np.float32)
+        query_norms = np.einsum("ij,ij->i", encodings, encodings)
+        centroid_norms = np.einsum("ij,ij->i", self.centroids, self.centroids)
+        centroid_distances = centroid_norms[None, :] - 2 * (encodings @ self.centroids.T)
+        probes = [self._probe(distances, nprobe, top_k) for distances in centroid_distances]
+
+        # One (query, list, slot) triple per probe, slot being the probe's position for its query
+        queries = np.repeat(np.arange(len(encodings)), [len(probed) for probed in probes])
+        lists = np.concatenate(probes)
+        slots = np.concatenate([np.arange(len(probed)) for probed in probes])
+        order = np.argsort(lists, kind="stable")
+        queries, lists, slots = queries[order], lists[order], slots[order]
+        bounds = np.flatnonzero(np.diff(lists)) + 1
+
+        # Each probe keeps only its best top_k faces
+        nearest = np.full((len(encodings), max(map(len, probes)), top_k), -1, dtype=np.int64)
+        nearest_distances = np.full(nearest.shape, np.inf, dtype=np.float32)
+        for group_queries, group_slots, list_id in zip(np.split(queries, bounds), np.split(slots, bounds),
+                                                       lists[np.r_[0, bounds]]):
+            members = self.lists[list_id]
+            if not len(members):
+                continue
+            block = encodings[group_queries]
+            squared = (query_norms[group_queries, None] - 2 * (block @ np.asarray(self.encodings[members]).T)
+                       + self.norms[members][None, :])
+            distances = np.sqrt(np.maximum(squared, 0))
+            k = min(top_k, len(members))
+            best = np.argpartition(distances, k - 1, axis=1)[:, :k]
+            nearest[group_queries, group_slots, :k] = members[best]
+            nearest_distances[group_queries, group_slots, :k] = np.take_along_axis(distances, best, axis=1)
+
+        nearest = nearest.reshape(len(encodings), -1)
+        nearest_distances = nearest_distances.reshape(len(encodings), -1)
+        results = []
+        for candidates, distances in zip(nearest, nearest_distances):
+            best = _top_k(distances, top_k)
+            best = best[candidates[best] >= 0]
+            results.append((candidates[best], distances[best]))
+        return results
+
+
+def build_face_index(encodings: np.ndarray, min_ivf_size: int = FACE_INDEX_MIN_SIZE):
+    """Brute force for small galleries, an IVF index from `min_ivf_size` faces"""
+    if min_ivf_size <= 0 or len(encodings) < min_ivf_size:
+        return BruteForceIndex(encodings)
+    index = IVFIndex(encodings)
+    logger.info(f"Built IVF face index over {len(encodings)} faces with {index.nlist} lists")
+    return index
+
+
+def needs_rebuild(index, size: int, min_ivf_size: int = FACE_INDEX_MIN_SIZE) -> bool:
+    """Whether a gallery grown to `size` has outgrown its index type or training"""
+    if isinstance(index, BruteForceIndex):
+        return 0 < min_ivf_size <= size
+    # Centroids trained on a much smaller gallery leave the lists unbalanced
+    return size > 2 * index.trained_size
@@ -0,0 +1,91 @@
+import io
+import os
+import asyncio
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Tuple
+import numpy as np
+from app.config import FACE_WORKERS, WEB_CONCURRENCY
+from app.face_gallery import ENCODING_SIZE
+
+logger = logging.getLogger(__name__)
+
+# (top, right, bottom, left) in pixels, as face_recognition reports it
+FaceLocation = Tuple[int, int, int, int]
+
+
+def _init_worker():
+    """Load the dlib detector and encoder models once per worker process"""
+    import face_recognition  # Builds the dlib models at import time
+    face_recognition.face_locations(np.zeros((32, 32, 3), dtype=np.uint8))
+
+
+def encode_faces(image_bytes: bytes) -> Tuple[List[FaceLocation], np.ndarray]:
+    """Detect every face in an image and return (locations, float32 encodings)"""
+    import face_recognition
+    image = face_recognition.load_image_file(io.BytesIO(image_bytes))
+    locations = face_recognition.face_locations(image)
+    encodings = face_recognition.face_encodings(image, known_face_locations=locations)
+    return [tuple(int(v) for v in location) for location in locations], \
+        np.array(encodings, dtype=np.float32).reshape(len(encodings), ENCODING_SIZE)
+
+
+class FaceWorkerPool:
+    """
+    Process pool for face detection and encoding.
+
+    dlib's HOG detector and ResNet encoder hold the GIL for hundreds of
+    milliseconds per image, so they run in separate processes instead of on
+    the event loop. Every web worker starts its own pool, so by default the
+    cores are split among the WEB_CONCURRENCY web workers rather than each
+    taking all of them. Workers are spawned rather than forked, because the
+    web process runs Redis and transfer threads.
+    """
+
+    def __init__(self, workers: int = FACE_WORKERS, web_workers: int = WEB_CONCURRENCY):
+        self.workers = workers or max(1, (os.cpu_count() or 1) // max(1, web_workers))
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker
+                )
+                logger.info(f"Started face worker pool with {self.workers} processes")
+            return self._executor
+
+    def start(self):
+        """Spawn the workers and load their models ahead of the first upload"""
+        executor = self._get_executor()
+        for future in [executor.submit(os.getpid) for _ in range(self.workers)]:
+            future.result()
+
+    async def encode(self, image_bytes: bytes) -> Tuple[List[FaceLocation], np.ndarray]:
+        """encode_faces in a worker process, awaited without blocking the loop"""
+        executor = self._get_executor()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(executor, encode_faces, image_bytes)
+        except BrokenProcessPool:
+            # A worker died (e.g. out of memory); start a fresh pool for later requests
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            executor.shutdown(wait=False)
+            raise
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+# Shared face worker pool
+face_workers = FaceWorkerPool()
@@ -0,0 +1,51 @@
+import threading
+from typing import Optional, Tuple, Iterable, Dict, Any
+from cachetools import TTLCache
+from app.config import FOLDER_CACHE_SIZE, FOLDER_CACHE_TTL
+
+FOLDER_MIME_TYPE = "application/vnd.google-apps.folder"
+
+
+class FolderParentCache:
+    """
+    folder ID -> (name, parent ID) for building breadcrumbs without Drive calls.
+
+    Filled from the listings the endpoints already fetch. Entries are
+    scoped to an account so one user's cache never answers for another.
+    """
+
+    def __init__(self, maxsize: int = FOLDER_CACHE_SIZE, ttl: float = FOLDER_CACHE_TTL):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def get(self, account: str, folder_id: str) -> Optional[Tuple[str, Optional[str]]]:
+        with self._lock:
+            return self._cache.get((account, folder_id))
+
+    def put(self, account: str, folder_id: str, name: str, parent_id: Optional[str]):
+        with self._lock:
+            self._cache[(account, folder_id)] = (name, parent_id)
+
+    def remember(self, account: str, items: Iterable[Dict[str, Any]], all_folders: bool = False,
+                 requested_parents: bool = True):
+        """
+        Cache every folder in a listing; `all_folders` for listings without mimeType.
+
+        Drive omits `parents` for the "My Drive" root, so when the listing
+        asked for the field a missing key is cached as having no parent.
+        """
+        entries = {}
+        for item in items:
+            if not all_folders and item.get("mimeType") != FOLDER_MIME_TYPE:
+                continue
+            if "name" not in item or ("parents" not in item and not requested_parents):
+                continue  # Listing did not ask for the fields a breadcrumb needs
+            parents = item.get("parents")
+            entries[(account, item["id"])] = (item["name"], parents[0] if parents else None)
+        if entries:
+            with self._lock:
+                self._cache.update(entries)
+
+
+# Shared breadcrumb cache
+folder_parents = FolderParentCache()
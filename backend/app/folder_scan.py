@@ -0,0 +1,96 @@
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Iterator, Dict, Any, List
+from app.config import FOLDER_SCAN_WORKERS, FOLDER_SCAN_BATCH_SIZE
+from app.drive_scheduler import drive_scheduler
+from app.drive_service import get_drive_service
+
+logger = logging.getLogger(__name__)
+
+FOLDER_MIME_TYPE = "application/vnd.google-apps.folder"
+
+SCAN_FIELDS = "id, name, mimeType, size, modifiedTime, createdTime, parents, webViewLink"
+
+
+def list_folders(credentials, folder_ids: List[str], fields: str = SCAN_FIELDS) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    List every item of several folders with one paged query.
+
+    The folders are OR-ed into a single `in parents` query and the results
+    are split back up by each item's `parents`, so K small folders cost
+    one call instead of K.
+    """
+    if "parents" not in fields:
+        fields = f"{fields}, parents"
+    service = get_drive_service(credentials)
+    parents_query = " or ".join(f"'{folder_id}' in parents" for folder_id in folder_ids)
+    listings = {folder_id: [] for folder_id in folder_ids}
+    page_token = None
+    while True:
+        results = drive_scheduler.execute(service.files().list(
+            q=f"({parents_query}) and trashed = false",
+            fields=f"nextPageToken, files({fields})",
+            pageSize=1000,
+            pageToken=page_token
+        ))
+        for item in results.get("files", []):
+            for parent in item.get("parents", []):
+                if parent in listings:
+                    listings[parent].append(item)
+        page_token = results.get("nextPageToken")
+        if not page_token:
+            return listings
+
+
+def scan_folder_tree(credentials, folder_id: str, root_path: str, max_depth: int,
+                     fields: str = SCAN_FIELDS, workers: int = FOLDER_SCAN_WORKERS,
+                     batch_size: int = FOLDER_SCAN_BATCH_SIZE) -> Iterator[Dict[str, Any]]:
+    """
+    Walk a folder tree breadth-first, listing up to `workers` queries at once.
+
+    Each query covers up to `batch_size` folders of the frontier. Yields
+    {"id", "path", "depth", "items"} for each folder as soon as its
+    listing is complete, so the wall time follows the depth of the tree
+    rather than the number of folders. Folders at depth `max_depth` or
+    deeper are reported as subfolders but not listed. A folder that could
+    not be listed is yielded with an "error" and no items.
+    """
+    if max_depth < 1:
+        return
+
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="folder-scan")
+    frontier = deque([(folder_id, root_path, 0)])
+    pending = {}
+    try:
+        while frontier or pending:
+            while frontier and len(pending) < workers:
+                batch = [frontier.popleft() for _ in range(min(batch_size, len(frontier)))]
+                future = pool.submit(list_folders, credentials, [entry[0] for entry in batch], fields)
+                pending[future] = batch
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                batch = pending.pop(future)
+                try:
+                    listings = future.result()
+                except Exception as e:
+                    logger.error(f"Error scanning folders {[entry[0] for entry in batch]}: {e}")
+                    for current_id, path, depth in batch:
+                        yield {"id": current_id, "path": path, "depth": depth, "items": [], "error": str(e)}
+                    continue
+
+                for current_id, path, depth in batch:
+                    items = listings[current_id]
+                    if depth + 1 < max_depth:
+                        for item in items:
+                            if item.get("mimeType") == FOLDER_MIME_TYPE:
+                                child_path = f"{path}/{item['name']}" if path else item["name"]
+                                frontier.append((item["id"], child_path, depth + 1))
+
+                    yield {"id": current_id, "path": path, "depth": depth, "items": items}
+    finally:
+        # Stop queued listings if the caller gave up early
+        for future in pending:
+            future.cancel()
+        pool.shutdown(wait=False)
@@ -0,0 +1,83 @@
+import json
+import hashlib
+from typing import Optional, Dict, Any, Iterable
+from app.config import LISTING_CACHE_TTL
+from app.redis_client import redis_client
+
+
+class ListingCache:
+    """
+    Short-lived Redis cache of listing responses, shared by all workers.
+
+    Cache keys embed generation counters instead of being deleted: a
+    listing of one folder depends on that folder's counter, listings
+    across the whole Drive on the account-wide "all" counter, and both on
+    the account's "epoch". Changing a folder bumps its counter and "all";
+    changes whose folders are unknown bump the epoch. Stale entries are
+    simply never read again and expire with their TTL.
+    """
+
+    def __init__(self, ttl: int = LISTING_CACHE_TTL):
+        self.ttl = ttl
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def key(self, account: str, endpoint: str, params: Dict[str, Any],
+            folder_id: Optional[str] = None) -> Optional[str]:
+        """Cache key for one listing request, or None when caching is off"""
+        if not self.enabled:
+            return None
+        scopes = ["epoch", f"folder:{folder_id}" if folder_id else "all"]
+        generations = redis_client.get_listing_generations(account, scopes)
+        if not generations:
+            return None
+        digest = hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()
+        return f"{account}:{endpoint}:{'.'.join(generations)}:{digest}"
+
+    def get(self, cache_key: Optional[str]) -> Optional[Dict[str, Any]]:
+        return redis_client.get_cached_listing(cache_key) if cache_key else None
+
+    def put(self, cache_key: Optional[str], response: Dict[str, Any]):
+        if cache_key and "error" not in response:
+            redis_client.store_cached_listing(cache_key, response, self.ttl)
+
+    def invalidate_folders(self, account: str, folder_ids: Iterable[Optional[str]]):
+        """Drop cached listings of the given folders; None or "root" drops the whole account"""
+        folder_ids = set(folder_ids)
+        if not folder_ids:
+            return
+        if None in folder_ids or "root" in folder_ids:
+            # The "root" alias and the real root ID are cached separately
+            self.invalidate_account(account)
+            return
+        redis_client.bump_listing_generations(account, ["all"] + [f"folder:{folder_id}" for folder_id in folder_ids])
+
+    def invalidate_account(self, account: str):
+        """Drop every cached listing of an account"""
+        redis_client.bump_listing_generations(account, ["epoch"])
+
+    def invalidate_changes(self, account: str, changes: Iterable[Dict[str, Any]]):
+        """Drop listings touched by Drive Changes API entries"""
+        folder_ids = set()
+        for change in changes:
+            item = change.get("file")
+            if change.get("removed") or not item or not item.get("parents"):
+                # The folder a removed file was in is not reported
+                self.invalidate_account(account)
+                return
+            folder_ids.update(item["parents"])
+        self.invalidate_folders(account, folder_ids)
+
+    def invalidate_transfer(self, source_token: str, dest_token: str, folder_id: Optional[str],
+                            delete_source: bool = False):
+        """Drop listings a finished transfer made stale"""
+        self.invalidate_folders(redis_client.get_account_key(dest_token), [folder_id])
+        if delete_source:
+            # The source file's old folder is not known here
+            self.invalidate_account(redis_client.get_account_key(source_token))
+
+
+# Shared listing response cache
+listing_cache = ListingCache()
@@ -1,6 +1,8 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.auth import router as auth_router  # 👈 Import your router
+from app.transfer_jobs import transfer_job_manager
+from app.face_workers import face_workers
 
 app = FastAPI()
 
@@ -14,4 +16,21 @@ app.add_middleware(
 )  # 👈 this closing parenthesis was missing
 
 # ✅ Register your routes
-app.include_router(auth_router)
\ No newline at end of file
+app.include_router(auth_router)
+
+# ✅ Pick up batch transfers interrupted by a restart
+@app.on_event("startup")
+def resume_transfer_jobs():
+    transfer_job_manager.resume_incomplete_jobs()
+
+# ✅ Load the face models in the worker processes before the first upload
+@app.on_event("startup")
+def start_face_workers():
+    try:
+        face_workers.start()
+    except Exception as e:
+        print(f"Face workers failed to start: {e}")
+
+@app.on_event("shutdown")
+def stop_face_workers():
+    face_workers.shutdown()
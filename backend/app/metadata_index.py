@@ -0,0 +1,451 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from urllib.request import pathname2url
+from datetime import datetime
+from typing import Optional, Dict, Any, List, Tuple
+from app.config import METADATA_INDEX_DIR, METADATA_INDEX_REFRESH_INTERVAL
+from app.redis_client import redis_client
+from app.drive_scheduler import drive_scheduler
+from app.drive_service import get_drive_service
+from app.listing_cache import listing_cache
+
+logger = logging.getLogger(__name__)
+
+FOLDER_MIME_TYPE = "application/vnd.google-apps.folder"
+
+INDEX_FIELDS = "id, name, mimeType, size, md5Checksum, modifiedTime, createdTime, parents, webViewLink, thumbnailLink, trashed"
+
+# Page tokens handed out for index results, so they never get sent to Drive
+PAGE_TOKEN_PREFIX = "idx:"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    mime_type TEXT NOT NULL,
+    size INTEGER,
+    md5 TEXT,
+    modified_time TEXT,
+    created_time TEXT,
+    web_view_link TEXT,
+    thumbnail_link TEXT
+);
+CREATE TABLE IF NOT EXISTS parents (
+    parent_id TEXT NOT NULL,
+    file_id TEXT NOT NULL,
+    PRIMARY KEY (parent_id, file_id)
+);
+CREATE INDEX IF NOT EXISTS parents_file ON parents (file_id);
+CREATE INDEX IF NOT EXISTS files_name ON files (name COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS files_modified ON files (modified_time);
+CREATE INDEX IF NOT EXISTS files_mime ON files (mime_type);
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# order_by values accepted by the listing endpoints, as SQL
+ORDER_BY_SQL = {
+    "name": "f.name COLLATE NOCASE",
+    "name desc": "f.name COLLATE NOCASE DESC",
+    "modifiedTime desc": "f.modified_time DESC",
+    "createdTime desc": "f.created_time DESC",
+    "size desc": "f.size DESC",
+    "folder,name": "f.mime_type != 'application/vnd.google-apps.folder', f.name COLLATE NOCASE"
+}
+
+
+def _row_to_file(row: sqlite3.Row, parents: List[str]) -> Dict[str, Any]:
+    """Shape an index row like a Drive files.list item"""
+    item = {
+        "id": row["id"],
+        "name": row["name"],
+        "mimeType": row["mime_type"],
+        "modifiedTime": row["modified_time"],
+        "createdTime": row["created_time"],
+        "parents": parents,
+        "webViewLink": row["web_view_link"]
+    }
+    if row["size"] is not None:
+        item["size"] = str(row["size"])
+    if row["md5"]:
+        item["md5Checksum"] = row["md5"]
+    if row["thumbnail_link"]:
+        item["thumbnailLink"] = row["thumbnail_link"]
+    return item
+
+
+class MetadataIndex:
+    """
+    Local SQLite copy of one account's Drive metadata.
+
+    Built by one full files.list crawl and kept fresh from the Changes
+    API, so folder browsing is served by indexed local queries. Only one
+    worker builds or refreshes an index at a time (Redis lock); readers
+    always see the last committed state.
+    """
+
+    def __init__(self, key: str, directory: str = METADATA_INDEX_DIR):
+        self.key = key
+        self.path = os.path.join(directory, f"{key}.sqlite3")
+        self._write_lock = threading.Lock()
+        self._refreshing = False
+        self._last_refresh = 0.0
+        os.makedirs(directory, exist_ok=True)
+        with self._connect(create=True) as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self, create: bool = False):
+        """
+        Connection that commits on success, rolls back on error and is always closed.
+
+        Only opening the index may create the file, so an index deleted
+        under a live object raises OperationalError instead of silently
+        coming back as an empty database.
+        """
+        mode = "rwc" if create else "rw"
+        conn = sqlite3.connect(f"file:{pathname2url(self.path)}?mode={mode}", uri=True, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    # State
+
+    def get_state(self) -> Dict[str, str]:
+        with self._connect() as conn:
+            return {row["key"]: row["value"] for row in conn.execute("SELECT key, value FROM state")}
+
+    def _set_state(self, conn: sqlite3.Connection, **values):
+        conn.executemany("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)",
+                         [(key, None if value is None else str(value)) for key, value in values.items()])
+
+    @property
+    def ready(self) -> bool:
+        return self.get_state().get("status") == "ready"
+
+    def status(self) -> Dict[str, Any]:
+        state = self.get_state()
+        with self._connect() as conn:
+            count = conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+        return {
+            "status": state.get("status", "missing"),
+            "files": count,
+            "builtAt": state.get("built_at"),
+            "refreshedAt": state.get("refreshed_at"),
+            "error": state.get("error")
+        }
+
+    # Writes
+
+    def _upsert(self, conn: sqlite3.Connection, items: List[Dict[str, Any]]):
+        conn.executemany(
+            "INSERT OR REPLACE INTO files (id, name, mime_type, size, md5, modified_time, created_time, "
+            "web_view_link, thumbnail_link) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(item["id"], item["name"], item["mimeType"], int(item["size"]) if item.get("size") else None,
+              item.get("md5Checksum"), item.get("modifiedTime"), item.get("createdTime"),
+              item.get("webViewLink"), item.get("thumbnailLink")) for item in items]
+        )
+        conn.executemany("DELETE FROM parents WHERE file_id = ?", [(item["id"],) for item in items])
+        conn.executemany("INSERT OR IGNORE INTO parents (parent_id, file_id) VALUES (?, ?)",
+                         [(parent, item["id"]) for item in items for parent in item.get("parents", [])])
+
+    def _remove(self, conn: sqlite3.Connection, file_ids: List[str]):
+        conn.executemany("DELETE FROM files WHERE id = ?", [(file_id,) for file_id in file_ids])
+        conn.executemany("DELETE FROM parents WHERE file_id = ?", [(file_id,) for file_id in file_ids])
+
+    def build(self, credentials):
+        """Crawl the whole Drive into the index with paged files.list calls"""
+        if not redis_client.acquire_metadata_index_lock(self.key, "build", 3600):
+            logger.info(f"Metadata index {self.key} is already being built or refreshed")
+            return
+
+        service = get_drive_service(credentials)
+        try:
+            with self._write_lock, self._connect() as conn:
+                self._set_state(conn, status="building", error=None)
+                conn.commit()
+
+                # Take the token first so changes made during the crawl are replayed later
+                start_token = drive_scheduler.execute(service.changes().getStartPageToken())["startPageToken"]
+                root_id = drive_scheduler.execute(service.files().get(fileId="root", fields="id"))["id"]
+
+                conn.execute("DELETE FROM files")
+                conn.execute("DELETE FROM parents")
+                page_token = None
+                crawled = 0
+                while True:
+                    results = drive_scheduler.execute(service.files().list(
+                        q="trashed = false",
+                        fields=f"nextPageToken, files({INDEX_FIELDS})",
+                        pageSize=1000,
+                        pageToken=page_token
+                    ))
+                    items = results.get("files", [])
+                    self._upsert(conn, items)
+                    crawled += len(items)
+                    page_token = results.get("nextPageToken")
+                    if not page_token:
+                        break
+
+                now = datetime.now().isoformat()
+                self._set_state(conn, status="ready", page_token=start_token, root_id=root_id,
+                                built_at=now, refreshed_at=now)
+                conn.commit()
+            self._last_refresh = time.monotonic()
+            logger.info(f"Built metadata index {self.key} with {crawled} files")
+        except Exception as e:
+            logger.error(f"Error building metadata index {self.key}: {e}")
+            with self._connect() as conn:
+                self._set_state(conn, status="failed", error=str(e))
+        finally:
+            redis_client.release_metadata_index_lock(self.key)
+
+    def refresh(self, credentials) -> int:
+        """Apply Drive changes since the last build or refresh; returns how many were applied"""
+        if not redis_client.acquire_metadata_index_lock(self.key, "refresh", 600):
+            return 0  # Another worker is on it
+
+        service = get_drive_service(credentials)
+        applied = 0
+        try:
+            with self._write_lock, self._connect() as conn:
+                state = {row["key"]: row["value"] for row in conn.execute("SELECT key, value FROM state")}
+                if state.get("status") != "ready":
+                    return 0
+
+                page_token = state["page_token"]
+                while True:
+                    results = drive_scheduler.execute(service.changes().list(
+                        pageToken=page_token,
+                        spaces="drive",
+                        includeRemoved=True,
+                        pageSize=1000,
+                        fields=f"nextPageToken, newStartPageToken, changes(fileId, removed, file({INDEX_FIELDS}))"
+                    ))
+                    changes = results.get("changes", [])
+                    live = [change["file"] for change in changes
+                            if not change.get("removed") and change.get("file") and not change["file"].get("trashed")]
+                    gone = [change["fileId"] for change in changes
+                            if change.get("removed") or not change.get("file") or change["file"].get("trashed")]
+                    # Listings of the folders files left or joined are stale now
+                    touched = set()
+                    for parents in self._parents_of(conn, [change["fileId"] for change in changes]).values():
+                        touched.update(parents)
+                    for item in live:
+                        touched.update(item.get("parents", []))
+                    listing_cache.invalidate_folders(self.key, touched)
+
+                    self._remove(conn, gone)
+                    self._upsert(conn, live)
+                    applied += len(changes)
+
+                    if "newStartPageToken" in results:
+                        self._set_state(conn, page_token=results["newStartPageToken"],
+                                        refreshed_at=datetime.now().isoformat())
+                        break
+                    page_token = results["nextPageToken"]
+                    self._set_state(conn, page_token=page_token)
+                conn.commit()
+            if applied:
+                logger.info(f"Applied {applied} changes to metadata index {self.key}")
+            return applied
+        finally:
+            self._last_refresh = time.monotonic()
+            redis_client.release_metadata_index_lock(self.key)
+
+    def refresh_in_background(self, credentials, interval: float = METADATA_INDEX_REFRESH_INTERVAL):
+        """Start a refresh if the index has not been refreshed for `interval` seconds"""
+        if self._refreshing or time.monotonic() - self._last_refresh < interval:
+            return
+        self._refreshing = True
+
+        def run():
+            try:
+                self.refresh(credentials)
+            except Exception as e:
+                logger.error(f"Error refreshing metadata index {self.key}: {e}")
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, name="metadata-index-refresh", daemon=True).start()
+
+    def delete(self):
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.remove(self.path + suffix)
+            except FileNotFoundError:
+                pass
+
+    # Reads
+
+    def _parents_of(self, conn: sqlite3.Connection, file_ids: List[str]) -> Dict[str, List[str]]:
+        parents = {file_id: [] for file_id in file_ids}
+        if file_ids:
+            placeholders = ",".join("?" * len(file_ids))
+            for row in conn.execute(f"SELECT file_id, parent_id FROM parents WHERE file_id IN ({placeholders})",
+                                    file_ids):
+                parents[row["file_id"]].append(row["parent_id"])
+        return parents
+
+    def resolve(self, file_id: str) -> str:
+        """Map the "root" alias to the account's real root folder ID"""
+        return self.get_state().get("root_id", file_id) if file_id == "root" else file_id
+
+    def get_file(self, file_id: str) -> Optional[Dict[str, Any]]:
+        file_id = self.resolve(file_id)
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM files WHERE id = ?", (file_id,)).fetchone()
+            if row is None:
+                if file_id == self.get_state().get("root_id"):
+                    # The root folder itself never shows up in files.list
+                    return {"id": file_id, "name": "My Drive", "mimeType": FOLDER_MIME_TYPE, "parents": []}
+                return None
+            return _row_to_file(row, self._parents_of(conn, [file_id])[file_id])
+
+    def list_files(self, parent_id: Optional[str] = None, mime_type: Optional[str] = None,
+                   folders: Optional[bool] = None, name_contains: Optional[str] = None,
+                   order_by: str = "name", page_token: Optional[str] = None,
+                   page_size: int = 100) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Query the index like files.list.
+
+        `folders` True/False keeps only folders/non-folders. Returns the
+        page of items and the next page token (None on the last page).
+        """
+        offset = int(page_token[len(PAGE_TOKEN_PREFIX):]) if page_token else 0
+        joins = ""
+        where = []
+        args: List[Any] = []
+        if parent_id:
+            joins = "JOIN parents p ON p.file_id = f.id"
+            where.append("p.parent_id = ?")
+            args.append(self.resolve(parent_id))
+        if mime_type:
+            where.append("f.mime_type = ?")
+            args.append(mime_type)
+        if folders is True:
+            where.append("f.mime_type = ?")
+            args.append(FOLDER_MIME_TYPE)
+        elif folders is False:
+            where.append("f.mime_type != ?")
+            args.append(FOLDER_MIME_TYPE)
+        if name_contains:
+            where.append("f.name LIKE ? ESCAPE '\\'")
+            escaped = name_contains.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            args.append(f"%{escaped}%")
+
+        sql = f"SELECT f.* FROM files f {joins}"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY {ORDER_BY_SQL.get(order_by, ORDER_BY_SQL['name'])}, f.id LIMIT ? OFFSET ?"
+        args.extend([page_size + 1, offset])
+
+        with self._connect() as conn:
+            rows = conn.execute(sql, args).fetchall()
+            more = len(rows) > page_size
+            rows = rows[:page_size]
+            parents = self._parents_of(conn, [row["id"] for row in rows])
+        items = [_row_to_file(row, parents[row["id"]]) for row in rows]
+        next_token = f"{PAGE_TOKEN_PREFIX}{offset + page_size}" if more else None
+        return items, next_token
+
+    def folder_path(self, folder_id: str) -> List[Dict[str, Any]]:
+        """Ancestors of a folder from the root down, including the folder itself"""
+        path = []
+        current_id = self.resolve(folder_id)
+        root_id = self.get_state().get("root_id")
+        seen = set()
+        with self._connect() as conn:
+            while current_id and current_id not in seen:
+                seen.add(current_id)
+                row = conn.execute("SELECT id, name FROM files WHERE id = ?", (current_id,)).fetchone()
+                if row is None:
+                    if current_id == root_id:
+                        path.append({"id": root_id, "name": "My Drive"})
+                    break
+                path.append({"id": row["id"], "name": row["name"]})
+                parent = conn.execute("SELECT parent_id FROM parents WHERE file_id = ? LIMIT 1",
+                                      (current_id,)).fetchone()
+                current_id = parent["parent_id"] if parent else None
+        path.reverse()
+        return path
+
+
+class MetadataIndexManager:
+    """Opens per-account indexes and decides whether a request can use one"""
+
+    def __init__(self, directory: str = METADATA_INDEX_DIR):
+        self.directory = directory
+        self._indexes: Dict[str, MetadataIndex] = {}
+        self._lock = threading.Lock()
+
+    def get(self, token: str, create: bool = False) -> Optional[MetadataIndex]:
+        key = redis_client.get_account_key(token)
+        with self._lock:
+            index = self._indexes.get(key)
+            if not os.path.exists(os.path.join(self.directory, f"{key}.sqlite3")):
+                # Deleted, possibly by another worker; never reuse the old object
+                self._indexes.pop(key, None)
+                if not create:
+                    return None
+                index = None
+            if index is None:
+                index = self._indexes[key] = MetadataIndex(key, self.directory)
+            return index
+
+    def _forget(self, index: MetadataIndex):
+        with self._lock:
+            if self._indexes.get(index.key) is index:
+                del self._indexes[index.key]
+
+    def for_request(self, token: str, credentials, page_token: Optional[str] = None) -> Optional[MetadataIndex]:
+        """
+        The account's index if it is ready and can serve this page, else None.
+
+        Drive page tokens are only valid for live listings, so a request
+        continuing a live listing is not switched over to the index.
+        """
+        if page_token and not page_token.startswith(PAGE_TOKEN_PREFIX):
+            return None
+        index = self.get(token)
+        if index is None:
+            return None
+        try:
+            if not index.ready:
+                return None
+        except sqlite3.Error as e:
+            # Removed or replaced while this process had it open; browse Drive live
+            logger.warning(f"Metadata index {index.key} is unusable, falling back to Drive: {e}")
+            self._forget(index)
+            return None
+        index.refresh_in_background(credentials)
+        return index
+
+    def build(self, token: str, credentials) -> MetadataIndex:
+        index = self.get(token, create=True)
+        threading.Thread(target=index.build, args=(credentials,), name="metadata-index-build", daemon=True).start()
+        return index
+
+    def remove(self, token: str) -> bool:
+        key = redis_client.get_account_key(token)
+        index = self.get(token)
+        if index is None:
+            return False
+        with self._lock:
+            self._indexes.pop(key, None)
+        index.delete()
+        return True
+
+
+# Shared registry of per-account metadata indexes
+metadata_indexes = MetadataIndexManager()
@@ -0,0 +1,80 @@
+import time
+from typing import Optional
+from app.config import PROGRESS_INTERVAL
+from app.redis_client import redis_client
+
+
+class ProgressReporter:
+    """
+    Publishes progress events for one file of a transfer or job.
+
+    Events go out through Redis pub/sub on the transfer's channel, so any
+    uvicorn worker can stream them. `update` is called from the chunk loop
+    and only publishes once per PROGRESS_INTERVAL seconds. A reporter
+    without a transfer ID does nothing.
+    """
+
+    def __init__(self, transfer_id: Optional[str], file_id: str, interval: float = PROGRESS_INTERVAL):
+        self.transfer_id = transfer_id
+        self.file_id = file_id
+        self.interval = interval
+        self.file_name = None
+        self.total_bytes = None
+        self._start_bytes = 0
+        self._started_at = None
+        self._last_published = 0.0
+
+    def _publish(self, event: dict):
+        if self.transfer_id:
+            event.update({"fileId": self.file_id, "fileName": self.file_name, "timestamp": time.time()})
+            redis_client.publish_transfer_event(self.transfer_id, event, snapshot_key=self.file_id)
+
+    def started(self, file_name: str, total_bytes: Optional[int] = None):
+        self.file_name = file_name
+        self.total_bytes = total_bytes
+        self._started_at = time.monotonic()
+        self._publish({"type": "file_started", "totalBytes": total_bytes})
+
+    def resumed_from(self, offset: int):
+        """Exclude bytes committed by an earlier attempt from the throughput"""
+        self._start_bytes = offset
+
+    def update(self, bytes_done: int):
+        if not self.transfer_id:
+            return
+        now = time.monotonic()
+        if now - self._last_published < self.interval:
+            return
+        self._last_published = now
+
+        elapsed = now - (self._started_at or now)
+        throughput = (bytes_done - self._start_bytes) / elapsed if elapsed > 0 else None
+        eta = None
+        if throughput and self.total_bytes is not None:
+            eta = max(0.0, (self.total_bytes - bytes_done) / throughput)
+
+        self._publish({
+            "type": "progress",
+            "bytesTransferred": bytes_done,
+            "totalBytes": self.total_bytes,
+            "throughputBytesPerSec": throughput,
+            "etaSeconds": eta
+        })
+
+    def completed(self, result: dict):
+        self._publish({
+            "type": "file_completed",
+            "totalBytes": self.total_bytes,
+            "destFileId": result.get("destFileId"),
+            "alreadyPresent": result.get("alreadyPresent", False),
+            "elapsedSeconds": time.monotonic() - self._started_at if self._started_at else None
+        })
+
+    def failed(self, error: Exception):
+        self._publish({"type": "file_failed", "error": str(error)})
+
+
+def publish_transfer_done(transfer_id: str, **details):
+    """Tell subscribers a transfer or job has no more events coming"""
+    event = {"type": "done", "timestamp": time.time(), **details}
+    redis_client.publish_transfer_event(transfer_id, event, snapshot_key="__done__")
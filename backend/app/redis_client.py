@@ -1,11 +1,20 @@
 # backend/app/redis_client.py
 import redis
+import redis.asyncio
 import json
 import os
 import uuid
+import hashlib
+import time
+import threading
 from datetime import datetime
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple
+from cachetools import TTLCache
 from google.oauth2.credentials import Credentials
+from google.auth.transport.requests import Request as GoogleAuthRequest
+
+# Channel on which workers announce deleted sessions
+CREDENTIALS_INVALIDATION_CHANNEL = "credentials_invalidated"
 
 class RedisClient:
     def __init__(self):
@@ -23,6 +32,8 @@ class RedisClient:
             password=self.password,
             decode_responses=True
         )
+        # asyncio connection for code on the event loop, created on first use
+        self._async_client = None
         
         # Test connection
         try:
@@ -32,7 +43,72 @@ class RedisClient:
             print("❌ Failed to connect to Redis")
             raise
 
-    def store_credentials(self, credentials: Credentials, session_type: str = "user") -> str:
+        # In-process cache of reconstructed credentials, kept consistent across
+        # workers by invalidation messages on logout
+        self._credentials_cache = TTLCache(
+            maxsize=int(os.getenv('CREDENTIALS_CACHE_SIZE', 1024)),
+            ttl=int(os.getenv('CREDENTIALS_CACHE_TTL', 60))
+        )
+        self._credentials_lock = threading.Lock()
+        # Striped locks so concurrent requests on one session refresh it once per worker
+        self._refresh_locks = [threading.Lock() for _ in range(64)]
+        self._invalidation_thread = None
+        self._start_credentials_invalidation()
+
+    def _start_credentials_invalidation(self):
+        """Listen for sessions deleted by any worker and drop them from the cache"""
+        try:
+            pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{CREDENTIALS_INVALIDATION_CHANNEL: self._on_credentials_invalidated})
+            self._invalidation_thread = pubsub.run_in_thread(
+                sleep_time=1.0,
+                daemon=True,
+                exception_handler=self._on_invalidation_error
+            )
+        except Exception as e:
+            print(f"Error subscribing to credential invalidations: {e}")
+
+    def _on_credentials_invalidated(self, message):
+        with self._credentials_lock:
+            self._credentials_cache.pop(message['data'], None)
+
+    def _on_invalidation_error(self, error, pubsub, thread):
+        # Invalidations may have been missed while disconnected, so start over
+        print(f"Credential invalidation listener error: {error}")
+        with self._credentials_lock:
+            self._credentials_cache.clear()
+        time.sleep(1.0)
+
+    def _load_session(self, token: str) -> Optional[Tuple[Dict[str, Any], Credentials]]:
+        """Get a session's stored data and credentials, from the in-process cache if possible"""
+        with self._credentials_lock:
+            cached = self._credentials_cache.get(token)
+        if cached is not None:
+            return cached
+
+        creds_data = self.redis_client.get(f"credentials:{token}")
+        if not creds_data:
+            return None
+
+        creds_dict = json.loads(creds_data)
+
+        # Reconstruct Credentials object
+        credentials = Credentials(
+            token=creds_dict['token'],
+            refresh_token=creds_dict.get('refresh_token'),
+            id_token=creds_dict.get('id_token'),
+            token_uri=creds_dict.get('token_uri'),
+            client_id=creds_dict.get('client_id'),
+            client_secret=creds_dict.get('client_secret'),
+            scopes=creds_dict.get('scopes'),
+            expiry=datetime.fromisoformat(creds_dict['expiry']) if creds_dict.get('expiry') else None
+        )
+
+        with self._credentials_lock:
+            self._credentials_cache[token] = (creds_dict, credentials)
+        return creds_dict, credentials
+
+    def store_credentials(self, credentials: Credentials, session_type: str = "user", email: Optional[str] = None) -> str:
         """Store Google OAuth credentials in Redis and return a unique token"""
         try:
             # Generate a unique token
@@ -48,6 +124,7 @@ class RedisClient:
                 'client_secret': credentials.client_secret,
                 'scopes': credentials.scopes,
                 'session_type': session_type,
+                'email': email.lower() if email else None,
                 'expiry': credentials.expiry.isoformat() if credentials.expiry else None,
                 'created_at': datetime.now().isoformat()
             }
@@ -73,30 +150,98 @@ class RedisClient:
     def get_credentials_by_token(self, token: str) -> Optional[Credentials]:
         """Retrieve credentials using token"""
         try:
-            key = f"credentials:{token}"
-            creds_data = self.redis_client.get(key)
-            
-            if not creds_data:
+            session = self._load_session(token)
+            if not session:
                 return None
-                
-            creds_dict = json.loads(creds_data)
-            
-            # Reconstruct Credentials object
-            credentials = Credentials(
-                token=creds_dict['token'],
-                refresh_token=creds_dict.get('refresh_token'),
-                id_token=creds_dict.get('id_token'),
-                token_uri=creds_dict.get('token_uri'),
-                client_id=creds_dict.get('client_id'),
-                client_secret=creds_dict.get('client_secret'),
-                scopes=creds_dict.get('scopes')
-            )
-            
+            credentials = session[1]
+            if credentials.expired and credentials.refresh_token:
+                return self.refresh_credentials(token)
             return credentials
         except Exception as e:
             print(f"Error retrieving credentials: {e}")
             return None
 
+    def refresh_credentials(self, token: str, lock_timeout: int = 30, wait_timeout: float = 15.0) -> Optional[Credentials]:
+        """
+        Refresh a session's access token at most once across all workers.
+
+        Threads of this worker queue on a local lock stripe; workers
+        coordinate through a Redis lock, which is polled without holding
+        the stripe. The holder calls Google and writes the new
+        access token and expiry back to Redis, everyone else picks them up
+        from there.
+        """
+        stripe = self._refresh_locks[hash(token) % len(self._refresh_locks)]
+        lock_key = f"credentials_refresh:{token}"
+        owner = str(uuid.uuid4())
+        deadline = time.monotonic() + wait_timeout
+        while True:
+            with stripe:
+                session = self._load_session(token)
+                if not session:
+                    return None
+                creds_dict, credentials = session
+                if not credentials.expired:
+                    return credentials  # Another thread refreshed the shared object
+
+                # Another worker may have refreshed it already
+                if self._adopt_stored_token(token, creds_dict, credentials):
+                    return credentials
+
+                if self.redis_client.set(lock_key, owner, nx=True, ex=lock_timeout):
+                    try:
+                        if self._adopt_stored_token(token, creds_dict, credentials):
+                            return credentials
+                        credentials.refresh(GoogleAuthRequest())
+                        creds_dict['token'] = credentials.token
+                        creds_dict['expiry'] = credentials.expiry.isoformat() if credentials.expiry else None
+                        self.redis_client.set(f"credentials:{token}", json.dumps(creds_dict), keepttl=True)
+                        print(f"🔄 Refreshed access token for session {token}")
+                        return credentials
+                    finally:
+                        if self.redis_client.get(lock_key) == owner:
+                            self.redis_client.delete(lock_key)
+
+            # Another worker is refreshing; wait outside the stripe so tokens
+            # that share it are not held up by this one
+            if time.monotonic() > deadline:
+                # Let the client library refresh on its own rather than fail the request
+                return credentials
+            time.sleep(0.1)
+
+    def _adopt_stored_token(self, token: str, creds_dict: Dict[str, Any], credentials: Credentials) -> bool:
+        """Copy a fresher access token from Redis into the cached credentials"""
+        creds_data = self.redis_client.get(f"credentials:{token}")
+        if not creds_data:
+            return False
+        stored = json.loads(creds_data)
+        if not stored.get('expiry') or stored['token'] == credentials.token:
+            return False
+
+        expiry = datetime.fromisoformat(stored['expiry'])
+        if Credentials(token=stored['token'], expiry=expiry).expired:
+            return False
+
+        credentials.token, credentials.expiry = stored['token'], expiry
+        creds_dict['token'] = stored['token']
+        creds_dict['expiry'] = stored['expiry']
+        return True
+
+    def get_account_email(self, token: str) -> Optional[str]:
+        """Get the verified account email stored with a token"""
+        try:
+            session = self._load_session(token)
+            return session[0].get('email') if session else None
+        except Exception as e:
+            print(f"Error retrieving account email: {e}")
+            return None
+
+    def get_account_key(self, token: str) -> str:
+        """Stable per-account cache key: the email's hash, or the token if the email is unknown"""
+        email = self.get_account_email(token)
+        account = email if email and email != "unknown" else token
+        return hashlib.sha256(account.encode("utf-8")).hexdigest()[:32]
+
     def get_credentials_by_type(self, session_type: str) -> Optional[Credentials]:
         """Get credentials by session type (source/destination)"""
         try:
@@ -116,6 +261,10 @@ class RedisClient:
         try:
             key = f"credentials:{token}"
             result = self.redis_client.delete(key)
+            with self._credentials_lock:
+                self._credentials_cache.pop(token, None)
+            # Other workers drop their cached copy too
+            self.redis_client.publish(CREDENTIALS_INVALIDATION_CHANNEL, token)
             return result > 0
         except Exception as e:
             print(f"Error deleting credentials: {e}")
@@ -135,5 +284,393 @@ class RedisClient:
             print(f"Error listing sessions: {e}")
             return {}
 
+    def create_transfer_job(self, job_id: str, job_data: Dict[str, Any], file_ids: List[str]) -> bool:
+        """Store a batch transfer job and mark all of its files as pending"""
+        try:
+            job_key = f"transfer_job:{job_id}"
+            files_key = f"transfer_job:{job_id}:files"
+            pending = json.dumps({'status': 'pending'})
+
+            pipe = self.redis_client.pipeline()
+            pipe.setex(job_key, 86400, json.dumps(job_data))
+            if file_ids:
+                pipe.hset(files_key, mapping={file_id: pending for file_id in file_ids})
+                pipe.expire(files_key, 86400)
+            pipe.execute()
+            return True
+        except Exception as e:
+            print(f"❌ Error creating transfer job: {e}")
+            raise e
+
+    def update_transfer_job(self, job_id: str, updates: Dict[str, Any]) -> bool:
+        """Merge fields into a transfer job's stored metadata"""
+        try:
+            job_key = f"transfer_job:{job_id}"
+            job_data = self.redis_client.get(job_key)
+            if not job_data:
+                return False
+            job = json.loads(job_data)
+            job.update(updates)
+            self.redis_client.set(job_key, json.dumps(job), keepttl=True)
+            return True
+        except Exception as e:
+            print(f"Error updating transfer job {job_id}: {e}")
+            return False
+
+    def add_transfer_job_files(self, job_id: str, file_ids: List[str], folder_id: Optional[str] = None) -> bool:
+        """Add newly discovered files to a job as pending"""
+        try:
+            files_key = f"transfer_job:{job_id}:files"
+            pending = json.dumps({'status': 'pending', 'folderId': folder_id})
+            pipe = self.redis_client.pipeline()
+            pipe.hset(files_key, mapping={file_id: pending for file_id in file_ids})
+            pipe.expire(files_key, 86400)
+            pipe.execute()
+            return True
+        except Exception as e:
+            print(f"Error adding files to transfer job {job_id}: {e}")
+            return False
+
+    def update_transfer_job_file(self, job_id: str, file_id: str, status: Dict[str, Any]) -> bool:
+        """Record the status of one file inside a batch transfer job"""
+        try:
+            files_key = f"transfer_job:{job_id}:files"
+            self.redis_client.hset(files_key, file_id, json.dumps(status))
+            return True
+        except Exception as e:
+            print(f"Error updating transfer job {job_id}: {e}")
+            return False
+
+    def get_transfer_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Get a batch transfer job with the per-file status map"""
+        try:
+            job_data = self.redis_client.get(f"transfer_job:{job_id}")
+            if not job_data:
+                return None
+
+            job = json.loads(job_data)
+            files = self.redis_client.hgetall(f"transfer_job:{job_id}:files")
+            job['files'] = {file_id: json.loads(status) for file_id, status in files.items()}
+            return job
+        except Exception as e:
+            print(f"Error retrieving transfer job: {e}")
+            return None
+
+    def save_transfer_checkpoint(self, key: str, checkpoint: Dict[str, Any]) -> bool:
+        """Store the committed offsets and upload session of an in-flight transfer"""
+        try:
+            checkpoint['updated_at'] = datetime.now().isoformat()
+            self.redis_client.setex(f"transfer_checkpoint:{key}", 86400, json.dumps(checkpoint))
+            return True
+        except Exception as e:
+            print(f"Error saving transfer checkpoint: {e}")
+            return False
+
+    def get_transfer_checkpoint(self, key: str) -> Optional[Dict[str, Any]]:
+        """Get the last checkpoint of an interrupted transfer"""
+        try:
+            checkpoint = self.redis_client.get(f"transfer_checkpoint:{key}")
+            return json.loads(checkpoint) if checkpoint else None
+        except Exception as e:
+            print(f"Error retrieving transfer checkpoint: {e}")
+            return None
+
+    def delete_transfer_checkpoint(self, key: str) -> bool:
+        """Delete the checkpoint of a finished transfer"""
+        try:
+            return self.redis_client.delete(f"transfer_checkpoint:{key}") > 0
+        except Exception as e:
+            print(f"Error deleting transfer checkpoint: {e}")
+            return False
+
+    def publish_transfer_event(self, transfer_id: str, event: Dict[str, Any], snapshot_key: Optional[str] = None) -> bool:
+        """Publish a progress event and keep it as the latest state for late subscribers"""
+        try:
+            payload = json.dumps(event)
+            progress_key = f"transfer_progress:{transfer_id}"
+            pipe = self.redis_client.pipeline()
+            if snapshot_key:
+                pipe.hset(progress_key, snapshot_key, payload)
+                pipe.expire(progress_key, 86400)
+            pipe.publish(f"transfer_events:{transfer_id}", payload)
+            pipe.execute()
+            return True
+        except Exception as e:
+            print(f"Error publishing transfer event: {e}")
+            return False
+
+    @property
+    def async_client(self) -> redis.asyncio.Redis:
+        if self._async_client is None:
+            self._async_client = redis.asyncio.Redis(
+                host=self.host,
+                port=self.port,
+                db=self.db,
+                password=self.password,
+                decode_responses=True
+            )
+        return self._async_client
+
+    def clear_transfer_progress(self, transfer_id: str) -> bool:
+        """Forget the progress snapshot of an earlier transfer that used this ID"""
+        try:
+            self.redis_client.delete(f"transfer_progress:{transfer_id}")
+            return True
+        except Exception as e:
+            print(f"Error clearing transfer progress: {e}")
+            return False
+
+    async def get_transfer_progress(self, transfer_id: str) -> Dict[str, Dict[str, Any]]:
+        """Get the latest progress event of every file in a transfer"""
+        try:
+            progress = await self.async_client.hgetall(f"transfer_progress:{transfer_id}")
+            return {key: json.loads(event) for key, event in progress.items()}
+        except Exception as e:
+            print(f"Error retrieving transfer progress: {e}")
+            return {}
+
+    async def subscribe_transfer_events(self, transfer_id: str):
+        """Open an asyncio pub/sub subscription to a transfer's progress channel"""
+        pubsub = self.async_client.pubsub(ignore_subscribe_messages=True)
+        await pubsub.subscribe(f"transfer_events:{transfer_id}")
+        return pubsub
+
+    def get_sync_state(self, sync_id: str) -> Optional[Dict[str, Any]]:
+        """Get the Changes API checkpoint of an incremental sync"""
+        try:
+            state = self.redis_client.get(f"sync_state:{sync_id}")
+            return json.loads(state) if state else None
+        except Exception as e:
+            print(f"Error retrieving sync state: {e}")
+            return None
+
+    def save_sync_state(self, sync_id: str, state: Dict[str, Any], ttl: int) -> bool:
+        """Store the Changes API checkpoint of an incremental sync"""
+        try:
+            state['updated_at'] = datetime.now().isoformat()
+            pipe = self.redis_client.pipeline()
+            pipe.setex(f"sync_state:{sync_id}", ttl, json.dumps(state))
+            # The ID map lives as long as the checkpoint it belongs to
+            pipe.expire(f"sync_map:{sync_id}", ttl)
+            pipe.execute()
+            return True
+        except Exception as e:
+            print(f"Error saving sync state: {e}")
+            return False
+
+    def get_sync_dest_ids(self, sync_id: str, source_ids: List[str]) -> Dict[str, str]:
+        """Look up the destination copies of source files and folders in a sync"""
+        try:
+            if not source_ids:
+                return {}
+            dest_ids = self.redis_client.hmget(f"sync_map:{sync_id}", source_ids)
+            return {source_id: dest_id for source_id, dest_id in zip(source_ids, dest_ids) if dest_id}
+        except Exception as e:
+            print(f"Error retrieving sync mapping: {e}")
+            return {}
+
+    def get_all_sync_dest_ids(self, sync_id: str) -> Dict[str, str]:
+        """Get the whole source -> destination ID map of a sync"""
+        try:
+            return self.redis_client.hgetall(f"sync_map:{sync_id}")
+        except Exception as e:
+            print(f"Error retrieving sync mapping: {e}")
+            return {}
+
+    def set_sync_dest_ids(self, sync_id: str, mapping: Dict[str, str]) -> bool:
+        """Record the destination copies of source files and folders in a sync"""
+        try:
+            if mapping:
+                self.redis_client.hset(f"sync_map:{sync_id}", mapping=mapping)
+            return True
+        except Exception as e:
+            print(f"Error updating sync mapping: {e}")
+            return False
+
+    def delete_sync_dest_ids(self, sync_id: str, source_ids: List[str]) -> bool:
+        """Forget source files and folders that left a sync"""
+        try:
+            if source_ids:
+                self.redis_client.hdel(f"sync_map:{sync_id}", *source_ids)
+            return True
+        except Exception as e:
+            print(f"Error deleting sync mapping: {e}")
+            return False
+
+    def acquire_sync_lock(self, sync_id: str, holder: str, ttl: int) -> bool:
+        """Let one run at a time read and advance a sync's checkpoint"""
+        try:
+            return bool(self.redis_client.set(f"sync_state:{sync_id}:lock", holder, nx=True, ex=ttl))
+        except Exception as e:
+            print(f"Error locking sync: {e}")
+            return False
+
+    def release_sync_lock(self, sync_id: str, holder: str) -> bool:
+        """Release a sync's run lock if this run still holds it"""
+        try:
+            key = f"sync_state:{sync_id}:lock"
+            if self.redis_client.get(key) != holder:
+                return False
+            return self.redis_client.delete(key) > 0
+        except Exception as e:
+            print(f"Error unlocking sync: {e}")
+            return False
+
+    def get_checksum_index(self, folder_key: str) -> Optional[Dict[str, str]]:
+        """Get the cached checksum -> file ID index of a destination folder"""
+        try:
+            index = self.redis_client.hgetall(f"checksum_index:{folder_key}")
+            if not index:
+                return None
+            index.pop('__built__', None)
+            return index
+        except Exception as e:
+            print(f"Error retrieving checksum index: {e}")
+            return None
+
+    def store_checksum_index(self, folder_key: str, index: Dict[str, str], ttl: int) -> bool:
+        """Cache the checksum -> file ID index of a destination folder"""
+        try:
+            key = f"checksum_index:{folder_key}"
+            pipe = self.redis_client.pipeline()
+            pipe.delete(key)
+            # The marker keeps an empty folder's index distinguishable from a missing one
+            pipe.hset(key, mapping={'__built__': '1', **index})
+            pipe.expire(key, ttl)
+            pipe.execute()
+            return True
+        except Exception as e:
+            print(f"Error storing checksum index: {e}")
+            return False
+
+    def add_checksum_index_entry(self, folder_key: str, checksum: str, file_id: str) -> bool:
+        """Add a newly created file to a cached folder index, if one exists"""
+        try:
+            key = f"checksum_index:{folder_key}"
+            if self.redis_client.exists(key):
+                self.redis_client.hset(key, checksum, file_id)
+            return True
+        except Exception as e:
+            print(f"Error updating checksum index: {e}")
+            return False
+
+    def remove_checksum_index_entry(self, folder_key: str, checksum: str) -> bool:
+        """Drop a stale entry from a cached folder index"""
+        try:
+            self.redis_client.hdel(f"checksum_index:{folder_key}", checksum)
+            return True
+        except Exception as e:
+            print(f"Error updating checksum index: {e}")
+            return False
+
+    def claim_transfer_job(self, job_id: str, worker_id: str, ttl: int = 60) -> bool:
+        """Take ownership of a job unless another live worker holds it, and list it as active"""
+        try:
+            if not self.redis_client.set(f"transfer_job:{job_id}:owner", worker_id, nx=True, ex=ttl):
+                return False
+            self.redis_client.sadd("transfer_jobs:active", job_id)
+            return True
+        except Exception as e:
+            print(f"Error claiming transfer job: {e}")
+            return False
+
+    def renew_transfer_job(self, job_id: str, worker_id: str, ttl: int = 60) -> bool:
+        """Extend this worker's ownership lease on a job"""
+        try:
+            return bool(self.redis_client.set(f"transfer_job:{job_id}:owner", worker_id, ex=ttl))
+        except Exception as e:
+            print(f"Error renewing transfer job: {e}")
+            return False
+
+    def release_transfer_job(self, job_id: str) -> bool:
+        """Drop the ownership lease of a finished job and take it off the active list"""
+        try:
+            pipe = self.redis_client.pipeline()
+            pipe.delete(f"transfer_job:{job_id}:owner")
+            pipe.srem("transfer_jobs:active", job_id)
+            return pipe.execute()[0] > 0
+        except Exception as e:
+            print(f"Error releasing transfer job: {e}")
+            return False
+
+    def get_listing_generations(self, account: str, scopes: List[str]) -> List[str]:
+        """Current generation counters of an account's listing cache scopes"""
+        try:
+            values = self.redis_client.mget([f"listing_gen:{account}:{scope}" for scope in scopes])
+            return [value or "0" for value in values]
+        except Exception as e:
+            print(f"Error retrieving listing generations: {e}")
+            return []
+
+    def bump_listing_generations(self, account: str, scopes: List[str], ttl: int = 86400) -> bool:
+        """Invalidate cached listings by moving their generation counters on"""
+        try:
+            pipe = self.redis_client.pipeline()
+            for scope in scopes:
+                key = f"listing_gen:{account}:{scope}"
+                pipe.incr(key)
+                # Counters must outlive the cached responses they guard
+                pipe.expire(key, ttl)
+            pipe.execute()
+            return True
+        except Exception as e:
+            print(f"Error bumping listing generations: {e}")
+            return False
+
+    def get_cached_listing(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        """Get a cached listing response"""
+        try:
+            data = self.redis_client.get(f"listing_cache:{cache_key}")
+            return json.loads(data) if data else None
+        except Exception as e:
+            print(f"Error retrieving cached listing: {e}")
+            return None
+
+    def store_cached_listing(self, cache_key: str, response: Dict[str, Any], ttl: int) -> bool:
+        """Cache a listing response for a short time"""
+        try:
+            self.redis_client.setex(f"listing_cache:{cache_key}", ttl, json.dumps(response))
+            return True
+        except Exception as e:
+            print(f"Error caching listing: {e}")
+            return False
+
+    def acquire_metadata_index_lock(self, index_key: str, holder: str, ttl: int) -> bool:
+        """Let one worker at a time build or refresh an account's metadata index"""
+        try:
+            return bool(self.redis_client.set(f"metadata_index:{index_key}:lock", holder, nx=True, ex=ttl))
+        except Exception as e:
+            print(f"Error locking metadata index: {e}")
+            return False
+
+    def release_metadata_index_lock(self, index_key: str) -> bool:
+        """Release the build/refresh lock of an account's metadata index"""
+        try:
+            return self.redis_client.delete(f"metadata_index:{index_key}:lock") > 0
+        except Exception as e:
+            print(f"Error unlocking metadata index: {e}")
+            return False
+
+    def list_active_transfer_job_ids(self) -> List[str]:
+        """List the IDs of jobs that were claimed and not yet released"""
+        try:
+            return list(self.redis_client.smembers("transfer_jobs:active"))
+        except Exception as e:
+            print(f"Error listing active transfer jobs: {e}")
+            return []
+
+    def list_transfer_job_ids(self) -> List[str]:
+        """List the IDs of all stored transfer jobs"""
+        try:
+            job_ids = []
+            for key in self.redis_client.scan_iter(match="transfer_job:*"):
+                parts = key.split(":")
+                if len(parts) == 2:
+                    job_ids.append(parts[1])
+            return job_ids
+        except Exception as e:
+            print(f"Error listing transfer jobs: {e}")
+            return []
+
 # Create a global Redis client instance
 redis_client = RedisClient()
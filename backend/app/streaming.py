@@ -0,0 +1,337 @@
+import threading
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Callable, Tuple
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaIoBaseDownload, MediaUpload
+from app.config import (
+    TRANSFER_CHUNK_SIZE,
+    STREAM_BUFFER_CHUNKS,
+    PARALLEL_DOWNLOAD_CONNECTIONS,
+    PARALLEL_DOWNLOAD_CHUNK_SIZE
+)
+from app.drive_scheduler import drive_scheduler
+from app.drive_service import get_drive_service
+
+logger = logging.getLogger(__name__)
+
+
+class TransferAborted(Exception):
+    """Raised on the download side when the upload side has given up"""
+
+
+class RingBuffer:
+    """
+    Bounded byte buffer shared between one writer (the download) and one
+    reader (the resumable upload).
+
+    Offsets are absolute positions in the transferred file. Bytes stay in
+    the buffer until the reader asks for a later offset, so a chunk the
+    upload has to resend after a 308 / retry is still available.
+    """
+
+    def __init__(self, capacity: int, start_offset: int = 0):
+        self._buf = bytearray(capacity)
+        self._capacity = capacity
+        self._head = start_offset  # oldest byte still retained
+        self._tail = start_offset  # one past the newest byte written
+        self._eof = False
+        self._closed = False
+        self._error: Optional[BaseException] = None
+        self._cond = threading.Condition()
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    @property
+    def written(self) -> int:
+        """Absolute offset one past the last byte received from the download"""
+        return self._tail
+
+    def rebase(self, offset: int):
+        """Move an unused buffer so the stream starts at `offset`"""
+        with self._cond:
+            if self._tail != self._head:
+                raise ValueError("Cannot rebase a buffer that already holds data")
+            self._head = self._tail = offset
+
+    def write(self, data) -> int:
+        """Append bytes, blocking while the buffer is full"""
+        view = memoryview(data)
+        total = len(view)
+        while len(view):
+            with self._cond:
+                while not self._closed and self._tail - self._head >= self._capacity:
+                    self._cond.wait()
+                if self._closed:
+                    raise TransferAborted("Upload side closed the stream")
+
+                n = min(len(view), self._capacity - (self._tail - self._head))
+                start = self._tail % self._capacity
+                first = min(n, self._capacity - start)
+                self._buf[start:start + first] = view[:first]
+                if n > first:
+                    self._buf[0:n - first] = view[first:n]
+                self._tail += n
+                self._cond.notify_all()
+            view = view[n:]
+        return total
+
+    def read_at(self, begin: int, length: int) -> bytes:
+        """
+        Return up to `length` bytes starting at absolute offset `begin`.
+
+        Everything before `begin` is released. Blocks until the range is
+        buffered or the writer has finished; a short result means EOF.
+        """
+        if length > self._capacity:
+            raise ValueError("Read length exceeds ring buffer capacity")
+
+        with self._cond:
+            if begin < self._head:
+                raise ValueError(f"Offset {begin} was already released from the stream")
+            self._head = min(begin, self._tail)
+            self._cond.notify_all()
+
+            while self._tail < begin + length and not self._eof and self._error is None:
+                self._cond.wait()
+            if self._error is not None:
+                raise self._error
+
+            end = min(begin + length, self._tail)
+            if end <= begin:
+                return b""
+            start = begin % self._capacity
+            n = end - begin
+            first = min(n, self._capacity - start)
+            chunk = bytes(self._buf[start:start + first])
+            if n > first:
+                chunk += bytes(self._buf[0:n - first])
+            return chunk
+
+    def finish(self):
+        """Mark the end of the stream"""
+        with self._cond:
+            self._eof = True
+            self._cond.notify_all()
+
+    def abort(self, error: BaseException):
+        """Fail any pending or future reads with `error`"""
+        with self._cond:
+            self._error = error
+            self._cond.notify_all()
+
+    def close(self):
+        """Release a writer blocked on a full buffer once the reader is done"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class RingBufferUpload(MediaUpload):
+    """Resumable MediaUpload that reads its body from a RingBuffer"""
+
+    def __init__(self, buffer: RingBuffer, mimetype: str, chunksize: int = TRANSFER_CHUNK_SIZE,
+                 size: Optional[int] = None):
+        super().__init__()
+        self._buffer = buffer
+        self._mimetype = mimetype
+        self._chunksize = chunksize
+        self._size = size
+
+    def chunksize(self):
+        return self._chunksize
+
+    def mimetype(self):
+        return self._mimetype
+
+    def size(self):
+        # None tells the client library the length is unknown until a short read
+        return self._size
+
+    def resumable(self):
+        return True
+
+    def getbytes(self, begin, length):
+        return self._buffer.read_at(begin, length)
+
+    def has_stream(self):
+        return False
+
+
+def media_download(request, chunk_size: int = TRANSFER_CHUNK_SIZE) -> Callable:
+    """
+    Download function for requests that cannot be ranged (e.g. export_media).
+
+    Returns a callable that streams `request` into a RingBuffer.
+    """
+    def download(buffer: RingBuffer, start_offset: int = 0):
+        if start_offset:
+            raise ValueError("This download cannot resume from an offset")
+        downloader = MediaIoBaseDownload(buffer, request, chunksize=chunk_size)
+        done = False
+        while not done:
+            _, done = drive_scheduler.call(request, downloader.next_chunk)
+
+    return download
+
+
+def ranged_download(service, file_id: str, size: int, chunk_size: int = TRANSFER_CHUNK_SIZE) -> Callable:
+    """
+    Download function for binary files using get_media with Range headers.
+
+    Returns a callable that streams bytes [start_offset, size) of the file
+    into a RingBuffer, so an interrupted transfer can pick up mid-file.
+    """
+    def download(buffer: RingBuffer, start_offset: int = 0):
+        offset = start_offset
+        while offset < size:
+            end = min(offset + chunk_size, size) - 1
+            request = service.files().get_media(fileId=file_id)
+            request.headers["Range"] = f"bytes={offset}-{end}"
+            content = drive_scheduler.execute(request, num_retries=3)
+            if not content:
+                raise Exception(f"Empty response for bytes {offset}-{end} of file {file_id}")
+            buffer.write(content)
+            offset += len(content)
+
+    return download
+
+
+def parallel_ranged_download(credentials, file_id: str, size: int,
+                             chunk_size: int = PARALLEL_DOWNLOAD_CHUNK_SIZE,
+                             connections: int = PARALLEL_DOWNLOAD_CONNECTIONS) -> Callable:
+    """
+    Download function that fetches `connections` byte ranges concurrently.
+
+    Ranges are requested in a sliding window and written to the RingBuffer
+    in file order, so at most `connections` chunks are held in memory on
+    top of the buffer. Each connection gets its own service object because
+    the underlying httplib2 connection is not thread-safe.
+    """
+    def download(buffer: RingBuffer, start_offset: int = 0):
+        local = threading.local()
+
+        def fetch(offset: int) -> bytes:
+            if not hasattr(local, "service"):
+                local.service = get_drive_service(credentials)
+            end = min(offset + chunk_size, size) - 1
+            request = local.service.files().get_media(fileId=file_id)
+            request.headers["Range"] = f"bytes={offset}-{end}"
+            content = drive_scheduler.execute(request, num_retries=3)
+            if len(content) != end - offset + 1:
+                raise Exception(f"Short response for bytes {offset}-{end} of file {file_id}")
+            return content
+
+        offsets = iter(range(start_offset, size, chunk_size))
+        window = deque()
+        with ThreadPoolExecutor(max_workers=connections, thread_name_prefix="drive-range") as pool:
+            try:
+                for _ in range(connections):
+                    offset = next(offsets, None)
+                    if offset is None:
+                        break
+                    window.append(pool.submit(fetch, offset))
+
+                while window:
+                    buffer.write(window.popleft().result())
+                    offset = next(offsets, None)
+                    if offset is not None:
+                        window.append(pool.submit(fetch, offset))
+            finally:
+                for future in window:
+                    future.cancel()
+
+    return download
+
+
+def query_upload_session(request, size: Optional[int] = None) -> Tuple[Optional[int], Optional[dict]]:
+    """
+    Ask Drive how much of an existing resumable upload session it has stored.
+
+    Returns (committed_bytes, None) while the upload is incomplete,
+    (None, created_file) if it already finished, and (None, None) if the
+    session no longer exists.
+    """
+    headers = {
+        "Content-Range": f"bytes */{size if size is not None else '*'}",
+        "Content-Length": "0"
+    }
+    resp, content = request.http.request(request.resumable_uri, method="PUT", headers=headers)
+
+    if resp.status in (200, 201):
+        return None, request.postproc(resp, content)
+    if resp.status == 308:
+        if "range" in resp:
+            return int(resp["range"].split("-")[1]) + 1, None
+        return 0, None
+    if resp.status in (404, 410):
+        return None, None
+    raise HttpError(resp, content, uri=request.resumable_uri)
+
+
+def stream_transfer(download: Callable, dest_service, body: dict, mimetype: str,
+                    size: Optional[int] = None, chunk_size: int = TRANSFER_CHUNK_SIZE,
+                    upload_uri: Optional[str] = None,
+                    on_checkpoint: Optional[Callable] = None,
+                    on_progress: Optional[Callable] = None) -> dict:
+    """
+    Copy one Drive media download into a new destination file without
+    holding the whole file in memory.
+
+    The download runs on a background thread and fills a bounded ring
+    buffer while the resumable upload drains it, so peak memory is a few
+    chunk sizes and the two directions overlap.
+
+    If `upload_uri` names an earlier upload session, the transfer resumes
+    from the bytes Drive already committed; `download` must then accept a
+    non-zero start offset. `on_checkpoint(upload_uri, uploaded, downloaded)`
+    and `on_progress(uploaded)` are called after every committed upload chunk.
+    """
+    buffer = RingBuffer(chunk_size * STREAM_BUFFER_CHUNKS)
+    media = RingBufferUpload(buffer, mimetype, chunksize=chunk_size, size=size)
+    request = dest_service.files().create(body=body, media_body=media)
+
+    start_offset = 0
+    if upload_uri:
+        request.resumable_uri = upload_uri
+        committed, created = query_upload_session(request, size)
+        if created is not None:
+            logger.info("Upload session was already complete, nothing to resume")
+            return created
+        if committed is None:
+            logger.info("Upload session expired, restarting transfer from the beginning")
+            request.resumable_uri = None
+        else:
+            logger.info(f"Resuming upload session at byte {committed}")
+            start_offset = committed
+            request.resumable_progress = committed
+            buffer.rebase(committed)
+
+    def pump():
+        try:
+            download(buffer, start_offset)
+            buffer.finish()
+        except TransferAborted:
+            pass
+        except Exception as e:
+            logger.error(f"Streaming download failed: {e}")
+            buffer.abort(e)
+
+    downloader_thread = threading.Thread(target=pump, name="drive-stream-download", daemon=True)
+    downloader_thread.start()
+
+    try:
+        response = None
+        while response is None:
+            _, response = drive_scheduler.call(request, request.next_chunk)
+            if response is None and on_checkpoint:
+                on_checkpoint(request.resumable_uri, request.resumable_progress, buffer.written)
+            if response is None and on_progress:
+                on_progress(request.resumable_progress)
+        return response
+    finally:
+        buffer.close()
+        downloader_thread.join()
@@ -0,0 +1,282 @@
+import uuid
+import hashlib
+import logging
+from typing import Optional, List, Dict, Any
+from googleapiclient.errors import HttpError
+from app.config import SYNC_STATE_TTL
+from app.redis_client import redis_client
+from app.drive_scheduler import drive_scheduler
+from app.drive_service import get_drive_service
+from app.transfer_jobs import transfer_job_manager, FOLDER_MIME_TYPE
+from app.listing_cache import listing_cache
+from app.folder_scan import scan_folder_tree
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on one run; the lock expires on its own if a worker dies mid-run
+SYNC_LOCK_SECONDS = 600
+
+
+class SyncBusy(Exception):
+    """Raised when another run of a sync is in progress or still has transfers in flight"""
+
+
+def sync_key(source_token: str, dest_token: str, folder_id: str, dest_folder_id: Optional[str] = None) -> str:
+    """
+    Identify a sync by accounts and folders rather than session tokens,
+    so a nightly run after a fresh login continues the same checkpoint.
+    """
+    def account(token: str) -> str:
+        email = redis_client.get_account_email(token)
+        return email if email and email != "unknown" else token
+
+    raw = f"{account(source_token)}:{folder_id}:{account(dest_token)}:{dest_folder_id or 'root'}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+def list_changes(service, page_token: str):
+    """Fetch every change since `page_token`; returns (changes, new_start_page_token)"""
+    changes = []
+    while True:
+        results = drive_scheduler.execute(service.changes().list(
+            pageToken=page_token,
+            spaces="drive",
+            includeRemoved=True,
+            pageSize=1000,
+            fields="nextPageToken, newStartPageToken, "
+                   "changes(fileId, removed, file(id, name, mimeType, md5Checksum, parents, trashed))"
+        ))
+        changes.extend(results.get("changes", []))
+        if "newStartPageToken" in results:
+            return changes, results["newStartPageToken"]
+        page_token = results["nextPageToken"]
+
+
+def _delete_dest(dest, dest_id: str):
+    """Delete a destination copy, ignoring copies that are already gone"""
+    try:
+        drive_scheduler.execute(dest.files().delete(fileId=dest_id))
+    except HttpError as e:
+        if e.resp.status != 404:
+            raise
+
+
+def _update_dest(dest, dest_id: str, name: str, dest_parent_id: str, current_parents: List[str]):
+    """Rename and/or move a destination copy to match its source"""
+    stale_parents = [p for p in current_parents if p != dest_parent_id]
+    moves = {}
+    if dest_parent_id not in current_parents:
+        moves["addParents"] = dest_parent_id
+    if stale_parents:
+        moves["removeParents"] = ",".join(stale_parents)
+    drive_scheduler.execute(dest.files().update(fileId=dest_id, body={"name": name}, fields="id", **moves))
+
+
+def _sync_metadata_only(dest, item: Dict[str, Any], dest_id: str, dest_parent_id: str) -> bool:
+    """
+    Apply a rename or move in place when the file's content is unchanged.
+
+    Returns False when the file has to be transferred again: its content
+    differs from the destination copy, the copy is gone, or it is a Google
+    Workspace file, which has no md5 to compare.
+    """
+    if not item.get("md5Checksum"):
+        return False
+    try:
+        current = drive_scheduler.execute(dest.files().get(
+            fileId=dest_id, fields="name, md5Checksum, parents, trashed"))
+    except HttpError as e:
+        if e.resp.status == 404:
+            return False
+        raise
+    if current.get("trashed") or current.get("md5Checksum") != item["md5Checksum"]:
+        return False
+    parents = current.get("parents", [])
+    if current.get("name") != item["name"] or parents != [dest_parent_id]:
+        _update_dest(dest, dest_id, item["name"], dest_parent_id, parents)
+    return True
+
+
+def _dest_tree_ids(dest_credentials, dest_folder_id: str) -> set:
+    """IDs of everything below a destination folder"""
+    ids = set()
+    for folder in scan_folder_tree(dest_credentials, dest_folder_id, "", max_depth=1000,
+                                   fields="id, mimeType, name"):
+        ids.update(item["id"] for item in folder["items"])
+    return ids
+
+
+def run_sync(source_credentials, dest_credentials, source_token: str, dest_token: str,
+             folder_id: str, dest_folder_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Bring the destination copy of a folder up to date.
+
+    The first run mirrors the whole tree as a folder job and records the
+    Changes API start page token. Later runs only read changes.list from
+    that token and apply creates, updates and deletes inside the synced
+    tree, so their cost follows the number of changes, not the tree size.
+    A source -> destination ID map in Redis ties the two trees together.
+    """
+    sync_id = sync_key(source_token, dest_token, folder_id, dest_folder_id)
+    holder = str(uuid.uuid4())
+    # Two concurrent runs would read the same page token and queue every change twice
+    if not redis_client.acquire_sync_lock(sync_id, holder, SYNC_LOCK_SECONDS):
+        raise SyncBusy("Another run of this sync is in progress")
+    try:
+        return _run_sync(source_credentials, dest_credentials, source_token, dest_token,
+                         folder_id, dest_folder_id, sync_id)
+    finally:
+        redis_client.release_sync_lock(sync_id, holder)
+
+
+def _run_sync(source_credentials, dest_credentials, source_token: str, dest_token: str,
+              folder_id: str, dest_folder_id: Optional[str], sync_id: str) -> Dict[str, Any]:
+    source = get_drive_service(source_credentials)
+    state = redis_client.get_sync_state(sync_id)
+
+    if state:
+        for job_id in state.get("job_ids", []):
+            job = transfer_job_manager.get_job(job_id)
+            if job and job["status"] == "running":
+                raise SyncBusy(f"Previous sync run is still transferring (job {job_id})")
+
+    if not state:
+        # Take the token before scanning so nothing changed during the mirror is missed
+        start_token = drive_scheduler.execute(source.changes().getStartPageToken())["startPageToken"]
+        job_id = transfer_job_manager.submit_folder(folder_id, source_token, dest_token,
+                                                    dest_parent_id=dest_folder_id, sync_id=sync_id)
+        redis_client.save_sync_state(sync_id, {
+            "page_token": start_token,
+            "source_folder_id": folder_id,
+            "dest_folder_id": dest_folder_id,
+            "job_ids": [job_id]
+        }, SYNC_STATE_TTL)
+        logger.info(f"Started full sync {sync_id} of folder {folder_id} as job {job_id}")
+        return {"syncId": sync_id, "mode": "full", "jobIds": [job_id]}
+
+    changes, new_token = list_changes(source, state["page_token"])
+    listing_cache.invalidate_changes(redis_client.get_account_key(source_token), changes)
+
+    # Only the last change of each file matters
+    latest: Dict[str, dict] = {}
+    for change in changes:
+        latest[change["fileId"]] = change
+
+    ids = set(latest)
+    for change in latest.values():
+        ids.update(change.get("file", {}).get("parents", []))
+    mapping = redis_client.get_sync_dest_ids(sync_id, list(ids))
+
+    dest = get_drive_service(dest_credentials)
+    counts = {"changes": len(latest), "foldersUpdated": 0, "filesUpdated": 0, "deleted": 0, "queued": 0}
+    unmapped: List[str] = []
+    job_ids: List[str] = []
+    by_dest_id: Dict[str, str] = {}
+
+    def is_folder(file_id: str, dest_id: str) -> bool:
+        item = latest[file_id].get("file")
+        if item:
+            return item.get("mimeType") == FOLDER_MIME_TYPE
+        # Removed changes carry no metadata; the destination copy has the same type
+        try:
+            copy = drive_scheduler.execute(dest.files().get(fileId=dest_id, fields="mimeType"))
+        except HttpError:
+            return False
+        return copy.get("mimeType") == FOLDER_MIME_TYPE
+
+    def remove(file_id: str):
+        dest_id = mapping.pop(file_id)
+        if is_folder(file_id, dest_id):
+            # Deleting a folder takes its whole destination subtree with it,
+            # so its descendants must leave the ID map as well
+            if not by_dest_id:
+                by_dest_id.update({d: s for s, d in redis_client.get_all_sync_dest_ids(sync_id).items()})
+            for descendant_id in _dest_tree_ids(dest_credentials, dest_id):
+                if descendant_id in by_dest_id:
+                    unmapped.append(by_dest_id[descendant_id])
+                    mapping.pop(by_dest_id[descendant_id], None)
+        _delete_dest(dest, dest_id)
+        unmapped.append(file_id)
+        counts["deleted"] += 1
+
+    # Deletions first, then folders, so files land in an up-to-date tree
+    live = {}
+    for file_id, change in latest.items():
+        if file_id == folder_id:
+            continue  # The synced root itself is never renamed or deleted
+        item = change.get("file")
+        if change.get("removed") or not item or item.get("trashed"):
+            if file_id in mapping:
+                remove(file_id)
+        else:
+            live[file_id] = item
+
+    folders = {file_id: item for file_id, item in live.items() if item["mimeType"] == FOLDER_MIME_TYPE}
+
+    # Folders new to the tree are mirrored with their contents, which also
+    # covers folders moved in from elsewhere whose children have no changes
+    new_roots: Dict[str, str] = {}
+    covered = set()
+    grew = True
+    while grew:
+        grew = False
+        for file_id, item in folders.items():
+            if file_id in mapping or file_id in new_roots or file_id in covered:
+                continue
+            parents = item.get("parents", [])
+            mapped_parent = next((p for p in parents if p in mapping), None)
+            if mapped_parent:
+                new_roots[file_id] = mapping[mapped_parent]
+                grew = True
+            elif any(p in new_roots or p in covered for p in parents):
+                covered.add(file_id)
+                grew = True
+
+    for file_id, item in folders.items():
+        if file_id not in mapping:
+            continue
+        mapped_parent = next((p for p in item.get("parents", []) if p in mapping), None)
+        if not mapped_parent:
+            remove(file_id)  # Moved out of the synced tree
+            continue
+        current = drive_scheduler.execute(dest.files().get(fileId=mapping[file_id], fields="parents"))
+        _update_dest(dest, mapping[file_id], item["name"], mapping[mapped_parent], current.get("parents", []))
+        counts["foldersUpdated"] += 1
+
+    for file_id, dest_parent_id in new_roots.items():
+        job_ids.append(transfer_job_manager.submit_folder(file_id, source_token, dest_token,
+                                                          dest_parent_id=dest_parent_id, sync_id=sync_id))
+
+    files_by_folder: Dict[str, List[str]] = {}
+    for file_id, item in live.items():
+        if file_id in folders:
+            continue
+        parents = item.get("parents", [])
+        if any(p in new_roots or p in covered for p in parents):
+            continue  # Copied by its new folder's mirror job
+        mapped_parent = next((p for p in parents if p in mapping), None)
+        if mapped_parent:
+            if file_id in mapping and _sync_metadata_only(dest, item, mapping[file_id], mapping[mapped_parent]):
+                counts["filesUpdated"] += 1  # Renamed or moved only; no need to copy the content
+                continue
+            # New or modified; the job replaces the previous copy once the new one is in place
+            files_by_folder.setdefault(mapping[mapped_parent], []).append(file_id)
+            counts["queued"] += 1
+        elif file_id in mapping:
+            remove(file_id)  # Moved out of the synced tree
+
+    job_id = transfer_job_manager.submit_files(files_by_folder, source_token, dest_token,
+                                               job_type='sync', sync_id=sync_id)
+    if job_id:
+        job_ids.append(job_id)
+
+    redis_client.delete_sync_dest_ids(sync_id, list(set(unmapped)))
+    if counts["deleted"] or counts["foldersUpdated"] or counts["filesUpdated"]:
+        listing_cache.invalidate_account(redis_client.get_account_key(dest_token))
+    state.update({"page_token": new_token, "job_ids": job_ids})
+    redis_client.save_sync_state(sync_id, state, SYNC_STATE_TTL)
+
+    logger.info(f"Incremental sync {sync_id}: {counts['changes']} changes, {counts['queued']} files queued, "
+                f"{len(new_roots)} new folders, {counts['deleted']} deleted")
+    return {"syncId": sync_id, "mode": "incremental", "jobIds": job_ids,
+            "newFolders": len(new_roots), **counts}
@@ -0,0 +1,502 @@
+import uuid
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Optional, List, Dict, Any
+from app.config import TRANSFER_WORKERS, FOLDER_MIRROR_WORKERS
+from app.redis_client import redis_client
+from app.drive_scheduler import drive_scheduler
+from app.drive_service import get_drive_service
+from app.progress import publish_transfer_done
+from app.listing_cache import listing_cache
+from app.transfers import transfer_drive_file, is_same_account, transfer_checkpoint_key
+
+logger = logging.getLogger(__name__)
+
+FOLDER_MIME_TYPE = "application/vnd.google-apps.folder"
+
+# Seconds a job stays owned by a worker that stopped renewing its lease
+JOB_LEASE_SECONDS = 60
+
+
+class TransferJobManager:
+    """
+    Runs batch transfers on a server-side worker pool.
+
+    Job and per-file status live in Redis so any uvicorn worker can answer
+    status queries; the transfers themselves run on this process's pool.
+    The owning worker holds a lease on each job it runs, so after a crash
+    another (or the restarted) worker can pick up the unfinished files.
+    """
+
+    def __init__(self, max_workers: int = TRANSFER_WORKERS, folder_workers: int = FOLDER_MIRROR_WORKERS):
+        self.max_workers = max_workers
+        self.worker_id = str(uuid.uuid4())
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="transfer-worker")
+        self._folder_executor = ThreadPoolExecutor(max_workers=folder_workers, thread_name_prefix="folder-mirror")
+        self._outstanding: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._heartbeat = None
+        self._resume_scanner = None
+
+    def _start_heartbeat(self):
+        if self._heartbeat is None:
+            self._heartbeat = threading.Thread(target=self._renew_leases, name="transfer-job-lease", daemon=True)
+            self._heartbeat.start()
+
+    def _renew_leases(self):
+        while True:
+            time.sleep(JOB_LEASE_SECONDS / 3)
+            with self._lock:
+                job_ids = list(self._outstanding)
+            for job_id in job_ids:
+                redis_client.renew_transfer_job(job_id, self.worker_id, JOB_LEASE_SECONDS)
+
+    def _start_resume_scanner(self):
+        with self._lock:
+            if self._resume_scanner is not None:
+                return
+            self._resume_scanner = threading.Thread(target=self._scan_for_orphaned_jobs,
+                                                    name="transfer-job-resume", daemon=True)
+        self._resume_scanner.start()
+
+    def _scan_for_orphaned_jobs(self):
+        # A job whose owner died just before a restart keeps its lease for up
+        # to JOB_LEASE_SECONDS, so the startup scan alone can miss it
+        while True:
+            time.sleep(JOB_LEASE_SECONDS)
+            try:
+                self.resume_incomplete_jobs(all_jobs=False)
+            except Exception as e:
+                logger.error(f"Error scanning for orphaned transfer jobs: {e}")
+
+    def _hold_job(self, job_id: str, units: int):
+        with self._lock:
+            self._outstanding[job_id] = self._outstanding.get(job_id, 0) + units
+        self._start_heartbeat()
+
+    def _queue_files(self, job_id: str, file_ids: List[str], source_token: str, dest_token: str,
+                     folder_id: Optional[str], delete_source: bool, dedup: bool,
+                     sync_id: Optional[str] = None):
+        self._hold_job(job_id, len(file_ids))
+
+        for file_id in file_ids:
+            self._executor.submit(self._run_file, job_id, file_id, source_token, dest_token,
+                                  folder_id, delete_source, dedup, sync_id)
+
+    def _file_finished(self, job_id: str):
+        with self._lock:
+            self._outstanding[job_id] -= 1
+            if self._outstanding[job_id] > 0:
+                return
+            del self._outstanding[job_id]
+        redis_client.release_transfer_job(job_id)
+        publish_transfer_done(job_id)
+
+    def submit_batch(self, file_ids: List[str], source_token: str, dest_token: str,
+                     folder_id: Optional[str] = None, delete_source: bool = False,
+                     dedup: bool = False) -> str:
+        """Create a job for `file_ids` and queue every file on the pool"""
+        job_id = str(uuid.uuid4())
+        # Keep order but drop repeated IDs, the status map is keyed by file ID
+        file_ids = list(dict.fromkeys(file_ids))
+
+        redis_client.create_transfer_job(job_id, {
+            'job_id': job_id,
+            'source_token': source_token,
+            'dest_token': dest_token,
+            'folder_id': folder_id,
+            'delete_source': delete_source,
+            'dedup': dedup,
+            'file_ids': file_ids,
+            'created_at': datetime.now().isoformat()
+        }, file_ids)
+
+        redis_client.claim_transfer_job(job_id, self.worker_id, JOB_LEASE_SECONDS)
+        self._queue_files(job_id, file_ids, source_token, dest_token, folder_id, delete_source, dedup)
+
+        logger.info(f"Queued transfer job {job_id} with {len(file_ids)} files")
+        return job_id
+
+    def _run_file(self, job_id: str, file_id: str, source_token: str, dest_token: str,
+                  folder_id: Optional[str], delete_source: bool, dedup: bool,
+                  sync_id: Optional[str] = None):
+        started_at = datetime.now().isoformat()
+        redis_client.update_transfer_job_file(job_id, file_id, {
+            'status': 'running',
+            'folderId': folder_id,
+            'startedAt': started_at
+        })
+
+        try:
+            source_credentials = redis_client.get_credentials_by_token(source_token)
+            dest_credentials = redis_client.get_credentials_by_token(dest_token)
+            if not source_credentials or not dest_credentials:
+                raise Exception("Invalid tokens or sessions expired")
+
+            result = transfer_drive_file(
+                source_credentials,
+                dest_credentials,
+                file_id,
+                folder_id=folder_id,
+                delete_source=delete_source,
+                same_account=is_same_account(source_token, dest_token),
+                resume_key=transfer_checkpoint_key(dest_token, file_id, folder_id),
+                dedup=dedup,
+                progress_id=job_id
+            )
+            if sync_id:
+                self._record_synced_file(sync_id, file_id, result['destFileId'], dest_credentials)
+            listing_cache.invalidate_transfer(source_token, dest_token, folder_id, delete_source)
+            redis_client.update_transfer_job_file(job_id, file_id, {
+                'status': 'skipped' if result['alreadyPresent'] else 'completed',
+                'message': result['message'],
+                'fileName': result['fileName'],
+                'destFileId': result['destFileId'],
+                'serverSide': result['serverSide'],
+                'folderId': folder_id,
+                'startedAt': started_at,
+                'finishedAt': datetime.now().isoformat()
+            })
+        except Exception as e:
+            logger.error(f"Error transferring file {file_id} in job {job_id}: {e}")
+            redis_client.update_transfer_job_file(job_id, file_id, {
+                'status': 'failed',
+                'error': str(e),
+                'folderId': folder_id,
+                'startedAt': started_at,
+                'finishedAt': datetime.now().isoformat()
+            })
+        finally:
+            self._file_finished(job_id)
+
+    def _record_synced_file(self, sync_id: str, file_id: str, dest_file_id: str, dest_credentials):
+        """Map a synced file to its new copy and drop the copy it replaces"""
+        previous_id = redis_client.get_sync_dest_ids(sync_id, [file_id]).get(file_id)
+        redis_client.set_sync_dest_ids(sync_id, {file_id: dest_file_id})
+        if previous_id and previous_id != dest_file_id:
+            try:
+                dest = get_drive_service(dest_credentials)
+                drive_scheduler.execute(dest.files().delete(fileId=previous_id))
+            except Exception as e:
+                logger.warning(f"Could not delete replaced copy {previous_id} in sync {sync_id}: {e}")
+
+    def submit_files(self, files_by_folder: Dict[Optional[str], List[str]], source_token: str,
+                     dest_token: str, job_type: str = 'batch', sync_id: Optional[str] = None) -> Optional[str]:
+        """
+        Create a job for files that go to different destination folders.
+
+        Returns None when there is nothing to transfer.
+        """
+        total = sum(len(file_ids) for file_ids in files_by_folder.values())
+        if not total:
+            return None
+
+        job_id = str(uuid.uuid4())
+        redis_client.create_transfer_job(job_id, {
+            'job_id': job_id,
+            'type': job_type,
+            'source_token': source_token,
+            'dest_token': dest_token,
+            'folder_id': None,
+            'delete_source': False,
+            'dedup': False,
+            'sync_id': sync_id,
+            'file_ids': [],
+            'created_at': datetime.now().isoformat()
+        }, [])
+
+        redis_client.claim_transfer_job(job_id, self.worker_id, JOB_LEASE_SECONDS)
+        # Held while queuing, so files of the first folder finishing early cannot finish the job
+        self._hold_job(job_id, 1)
+        try:
+            for folder_id, file_ids in files_by_folder.items():
+                if file_ids:
+                    redis_client.add_transfer_job_files(job_id, file_ids, folder_id=folder_id)
+                    self._queue_files(job_id, file_ids, source_token, dest_token, folder_id,
+                                      False, False, sync_id)
+        finally:
+            self._file_finished(job_id)
+
+        logger.info(f"Queued {job_type} job {job_id} with {total} files")
+        return job_id
+
+    def submit_folder(self, source_folder_id: str, source_token: str, dest_token: str,
+                      dest_parent_id: Optional[str] = None, dedup: bool = False,
+                      sync_id: Optional[str] = None) -> str:
+        """
+        Create a job that mirrors a whole folder tree to the destination.
+
+        Folders are recreated breadth-first with siblings created
+        concurrently, and each folder's files are queued on the transfer
+        pool as soon as their destination folder exists.
+        """
+        job_id = str(uuid.uuid4())
+        redis_client.create_transfer_job(job_id, {
+            'job_id': job_id,
+            'type': 'folder',
+            'source_token': source_token,
+            'dest_token': dest_token,
+            'source_folder_id': source_folder_id,
+            'folder_id': dest_parent_id,
+            'delete_source': False,
+            'dedup': dedup,
+            'sync_id': sync_id,
+            'file_ids': [],
+            'scan_status': 'scanning',
+            'folders_created': 0,
+            'created_at': datetime.now().isoformat()
+        }, [])
+
+        redis_client.claim_transfer_job(job_id, self.worker_id, JOB_LEASE_SECONDS)
+        # The scan counts as outstanding work so the job lease is kept while it runs
+        self._hold_job(job_id, 1)
+        threading.Thread(
+            target=self._mirror_folder,
+            args=(job_id, source_folder_id, source_token, dest_token, dest_parent_id, dedup, sync_id),
+            name=f"folder-mirror-{job_id[:8]}",
+            daemon=True
+        ).start()
+
+        logger.info(f"Started folder mirror job {job_id} for folder {source_folder_id}")
+        return job_id
+
+    def _mirror_folder(self, job_id: str, source_folder_id: str, source_token: str, dest_token: str,
+                       dest_parent_id: Optional[str], dedup: bool, sync_id: Optional[str] = None,
+                       known_files: Optional[set] = None):
+        """
+        Recreate the folder tree and queue its files.
+
+        `known_files` marks a re-run of an interrupted scan: folders that
+        already exist at the destination are reused instead of created
+        again, and files the job already has are not queued twice.
+        """
+        local = threading.local()
+        outstanding = [0]
+        errors = []
+        folders_created = [0]
+        done = threading.Condition()
+
+        def services():
+            # httplib2 connections are not thread-safe, so each pool thread gets its own pair
+            if not hasattr(local, "source"):
+                source_credentials = redis_client.get_credentials_by_token(source_token)
+                dest_credentials = redis_client.get_credentials_by_token(dest_token)
+                if not source_credentials or not dest_credentials:
+                    raise Exception("Invalid tokens or sessions expired")
+                local.source = get_drive_service(source_credentials)
+                local.dest = get_drive_service(dest_credentials)
+            return local.source, local.dest
+
+        def submit(fn, *args):
+            with done:
+                outstanding[0] += 1
+            self._folder_executor.submit(run, fn, *args)
+
+        def run(fn, *args):
+            try:
+                fn(*args)
+            except Exception as e:
+                logger.error(f"Error mirroring folder in job {job_id}: {e}")
+                errors.append(str(e))
+            finally:
+                with done:
+                    outstanding[0] -= 1
+                    done.notify_all()
+
+        def find_folder(dest, name: str, parent_id: Optional[str]) -> Optional[str]:
+            escaped = name.replace("\\", "\\\\").replace("'", "\\'")
+            results = drive_scheduler.execute(dest.files().list(
+                q=f"name = '{escaped}' and '{parent_id or 'root'}' in parents "
+                  f"and mimeType = '{FOLDER_MIME_TYPE}' and trashed = false",
+                fields="files(id)",
+                pageSize=1
+            ))
+            found = results.get("files", [])
+            return found[0]["id"] if found else None
+
+        def create_folder(name: str, parent_id: Optional[str]) -> str:
+            _, dest = services()
+            if known_files is not None:
+                existing_id = find_folder(dest, name, parent_id)
+                if existing_id:
+                    return existing_id
+            body = {"name": name, "mimeType": FOLDER_MIME_TYPE}
+            if parent_id:
+                body["parents"] = [parent_id]
+            created = drive_scheduler.execute(dest.files().create(body=body, fields="id"))
+            listing_cache.invalidate_folders(redis_client.get_account_key(dest_token), [parent_id])
+            with done:
+                folders_created[0] += 1
+            return created["id"]
+
+        def visit(source_id: str, dest_id: str):
+            source, _ = services()
+            files = []
+            page_token = None
+            while True:
+                results = drive_scheduler.execute(source.files().list(
+                    q=f"'{source_id}' in parents and trashed = false",
+                    fields="nextPageToken, files(id, name, mimeType)",
+                    pageSize=1000,
+                    pageToken=page_token
+                ))
+                for item in results.get("files", []):
+                    if item.get("mimeType") == FOLDER_MIME_TYPE:
+                        # Sibling folders are created concurrently on the folder pool
+                        submit(create_and_visit, item["id"], item["name"], dest_id)
+                    else:
+                        files.append(item["id"])
+                page_token = results.get("nextPageToken")
+                if not page_token:
+                    break
+
+            if known_files is not None:
+                files = [file_id for file_id in files if file_id not in known_files]
+            if files:
+                redis_client.add_transfer_job_files(job_id, files, folder_id=dest_id)
+                self._queue_files(job_id, files, source_token, dest_token, dest_id, False, dedup, sync_id)
+
+        def create_and_visit(source_id: str, name: str, parent_id: Optional[str]):
+            dest_id = create_folder(name, parent_id)
+            if sync_id:
+                redis_client.set_sync_dest_ids(sync_id, {source_id: dest_id})
+            visit(source_id, dest_id)
+
+        try:
+            source, _ = services()
+            root = drive_scheduler.execute(source.files().get(fileId=source_folder_id, fields="id, name, mimeType"))
+            if root.get("mimeType") != FOLDER_MIME_TYPE:
+                raise Exception("Specified ID is not a folder")
+
+            submit(create_and_visit, root["id"], root["name"], dest_parent_id)
+            with done:
+                while outstanding[0]:
+                    done.wait()
+
+            redis_client.update_transfer_job(job_id, {
+                'scan_status': 'failed' if errors else 'completed',
+                'scan_errors': errors,
+                'folders_created': folders_created[0]
+            })
+        except Exception as e:
+            logger.error(f"Error in folder mirror job {job_id}: {e}")
+            redis_client.update_transfer_job(job_id, {
+                'scan_status': 'failed',
+                'scan_errors': errors + [str(e)],
+                'folders_created': folders_created[0]
+            })
+        finally:
+            self._file_finished(job_id)
+
+    def resume_incomplete_jobs(self, all_jobs: bool = True) -> int:
+        """
+        Re-queue unfinished files of jobs whose owner is gone.
+
+        Called at startup and then every JOB_LEASE_SECONDS, so jobs whose
+        owner's lease was still live at startup are picked up once it
+        expires. The startup call looks at every stored job; the periodic
+        ones (`all_jobs=False`) only at the active set of claimed,
+        unreleased jobs. Files that were mid-transfer continue from their
+        Redis checkpoint. Returns the number of files re-queued.
+        """
+        self._start_resume_scanner()
+        requeued = 0
+        job_ids = redis_client.list_transfer_job_ids() if all_jobs else redis_client.list_active_transfer_job_ids()
+        for job_id in job_ids:
+            with self._lock:
+                if job_id in self._outstanding:
+                    continue  # Running here
+            # Claimed before the file map is read, so jobs a live worker owns cost one SET
+            if not redis_client.claim_transfer_job(job_id, self.worker_id, JOB_LEASE_SECONDS):
+                continue
+            job = redis_client.get_transfer_job(job_id)
+            unfinished = [file_id for file_id, status in job['files'].items()
+                          if status.get('status') in ('pending', 'running')] if job else []
+            scan_interrupted = bool(job) and job.get('scan_status') == 'scanning'
+            if not unfinished and not scan_interrupted:
+                # Finished (or expired) after its owner stopped; nothing to resume
+                redis_client.release_transfer_job(job_id)
+                continue
+
+            # Held before any file is queued so the job cannot finish before all groups
+            # are queued, or before its scan when that is re-run below
+            self._hold_job(job_id, 1 + scan_interrupted)
+
+            # Files of a folder mirror go to different destination folders
+            by_folder: Dict[Optional[str], List[str]] = {}
+            for file_id in unfinished:
+                folder_id = job['files'][file_id].get('folderId', job.get('folder_id'))
+                by_folder.setdefault(folder_id, []).append(file_id)
+
+            logger.info(f"Resuming transfer job {job_id} with {len(unfinished)} unfinished files")
+            try:
+                for folder_id, file_ids in by_folder.items():
+                    self._queue_files(job_id, file_ids, job['source_token'], job['dest_token'],
+                                      folder_id, job.get('delete_source', False), job.get('dedup', False),
+                                      job.get('sync_id'))
+            finally:
+                self._file_finished(job_id)
+            requeued += len(unfinished)
+            if scan_interrupted:
+                # Re-run the mirror; it reuses the folders created so far and
+                # only queues files the job does not have yet
+                logger.info(f"Re-running interrupted folder scan of job {job_id}")
+                threading.Thread(
+                    target=self._mirror_folder,
+                    args=(job_id, job['source_folder_id'], job['source_token'], job['dest_token'],
+                          job.get('folder_id'), job.get('dedup', False), job.get('sync_id'),
+                          set(job['files'])),
+                    name=f"folder-mirror-{job_id[:8]}",
+                    daemon=True
+                ).start()
+        return requeued
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return job status with per-file results and a summary"""
+        job = redis_client.get_transfer_job(job_id)
+        if not job:
+            return None
+
+        files = job['files']
+        counts = {'pending': 0, 'running': 0, 'completed': 0, 'skipped': 0, 'failed': 0}
+        for status in files.values():
+            counts[status['status']] = counts.get(status['status'], 0) + 1
+
+        scan_status = job.get('scan_status')
+        if counts['pending'] or counts['running'] or scan_status == 'scanning':
+            job_status = 'running'
+        elif counts['failed'] or scan_status in ('failed', 'interrupted'):
+            job_status = 'completed_with_errors'
+        else:
+            job_status = 'completed'
+
+        # Batch jobs keep the requested order, folder mirrors list files as discovered
+        requested = set(job['file_ids'])
+        ordered = [file_id for file_id in job['file_ids'] if file_id in files]
+        ordered += [file_id for file_id in files if file_id not in requested]
+
+        result = {
+            'jobId': job_id,
+            'type': job.get('type', 'batch'),
+            'status': job_status,
+            'folderId': job.get('folder_id'),
+            'deleteSource': job.get('delete_source'),
+            'createdAt': job.get('created_at'),
+            'summary': {'totalFiles': len(files), **counts},
+            'files': [{'fileId': file_id, **files[file_id]} for file_id in ordered]
+        }
+        if job.get('type') == 'folder':
+            result['sourceFolderId'] = job.get('source_folder_id')
+            result['scanStatus'] = scan_status
+            result['scanErrors'] = job.get('scan_errors', [])
+            result['foldersCreated'] = job.get('folders_created', 0)
+        if job.get('sync_id'):
+            result['syncId'] = job['sync_id']
+        return result
+
+
+# Shared worker pool for batch transfers
+transfer_job_manager = TransferJobManager()
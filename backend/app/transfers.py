@@ -0,0 +1,347 @@
+import io
+import os
+import logging
+from typing import Optional, Dict, Tuple
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaIoBaseDownload, MediaIoBaseUpload
+from app.redis_client import redis_client
+from app.drive_scheduler import drive_scheduler
+from app.drive_service import get_drive_service
+from app.progress import ProgressReporter
+from app.config import PARALLEL_DOWNLOAD_THRESHOLD, DEDUP_INDEX_TTL
+from app.streaming import stream_transfer, ranged_download, parallel_ranged_download, media_download
+from app.export_cache import export_cache, cached_file_download, caching_download
+
+logger = logging.getLogger(__name__)
+
+# Define export formats for Google Workspace files
+EXPORT_TYPES = {
+    "application/vnd.google-apps.document": "application/pdf",
+    "application/vnd.google-apps.spreadsheet": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "application/vnd.google-apps.presentation": "application/pdf",
+    "application/vnd.google-apps.drawing": "image/png"
+}
+
+
+def get_file_extension(mime_type):
+    """Get appropriate file extension for a given MIME type"""
+    ext_map = {
+        "application/pdf": ".pdf",
+        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet": ".xlsx",
+        "application/vnd.openxmlformats-officedocument.wordprocessingml.document": ".docx",
+        "application/vnd.openxmlformats-officedocument.presentationml.presentation": ".pptx",
+        "image/png": ".png",
+        "image/jpeg": ".jpg",
+        "text/plain": ".txt",
+        "text/csv": ".csv"
+    }
+    return ext_map.get(mime_type, "")
+
+
+def is_same_account(source_token: str, dest_token: str) -> bool:
+    """Check whether two session tokens belong to the same verified Google account"""
+    if source_token == dest_token:
+        return True
+    source_email = redis_client.get_account_email(source_token)
+    dest_email = redis_client.get_account_email(dest_token)
+    if not source_email or source_email == "unknown":
+        return False
+    return source_email == dest_email
+
+
+def server_side_transfer(service, file_id: str, meta: dict, folder_id: Optional[str] = None,
+                         delete_source: bool = False) -> dict:
+    """
+    Copy or move a file inside one account with metadata calls only.
+
+    Drive does the work server-side, so no bytes pass through this server
+    and Workspace files keep their native format.
+    """
+    target_parent = folder_id or "root"
+
+    if delete_source:
+        # A move is just a parent change
+        moved = drive_scheduler.execute(service.files().update(
+            fileId=file_id,
+            addParents=target_parent,
+            removeParents=",".join(meta.get("parents", [])),
+            fields="id, name"
+        ))
+        dest_file_id = moved["id"]
+    else:
+        copied = drive_scheduler.execute(service.files().copy(
+            fileId=file_id,
+            body={"name": meta["name"], "parents": [target_parent]},
+            fields="id, name"
+        ))
+        dest_file_id = copied["id"]
+
+    logger.info(f"Server-side {'move' if delete_source else 'copy'} of '{meta['name']}' completed")
+    return {
+        "message": f"✅ File '{meta['name']}' transferred successfully.",
+        "fileName": meta["name"],
+        "destFileId": dest_file_id,
+        "serverSide": True,
+        "alreadyPresent": False
+    }
+
+
+def folder_checksum_index(service, folder_id: Optional[str] = None) -> Tuple[str, Dict[str, str]]:
+    """
+    Get the "md5:size" -> file ID index of a destination folder.
+
+    The index is built with one paged listing and cached in Redis, so
+    repeated dedup checks against the same folder cost no Drive calls.
+    Returns the folder's cache key and the index.
+    """
+    if not folder_id:
+        # "root" is an alias, the index needs the account's real root ID
+        folder_id = drive_scheduler.execute(service.files().get(fileId="root", fields="id"))["id"]
+
+    index = redis_client.get_checksum_index(folder_id)
+    if index is not None:
+        return folder_id, index
+
+    index = {}
+    page_token = None
+    while True:
+        results = drive_scheduler.execute(service.files().list(
+            q=f"'{folder_id}' in parents and trashed = false",
+            fields="nextPageToken, files(id, md5Checksum, size)",
+            pageSize=1000,
+            pageToken=page_token
+        ))
+        for item in results.get("files", []):
+            if item.get("md5Checksum"):
+                index[f"{item['md5Checksum']}:{item.get('size')}"] = item["id"]
+        page_token = results.get("nextPageToken")
+        if not page_token:
+            break
+
+    redis_client.store_checksum_index(folder_id, index, DEDUP_INDEX_TTL)
+    return folder_id, index
+
+
+def is_dedup_match(service, file_id: str, checksum: str, folder_id: str) -> bool:
+    """
+    Confirm a cached checksum index entry against Drive.
+
+    The index can be up to DEDUP_INDEX_TTL old, so the file it names may
+    since have been trashed, deleted, changed or moved out of the folder.
+    """
+    try:
+        current = drive_scheduler.execute(service.files().get(
+            fileId=file_id, fields="trashed, md5Checksum, size, parents"))
+    except HttpError as e:
+        if e.resp.status == 404:
+            return False
+        raise
+    return (not current.get("trashed")
+            and f"{current.get('md5Checksum')}:{current.get('size')}" == checksum
+            and folder_id in current.get("parents", []))
+
+
+def transfer_checkpoint_key(dest_token: str, file_id: str, folder_id: Optional[str] = None) -> str:
+    """Stable identifier for one file transfer, used to find its checkpoint after a restart"""
+    return f"{dest_token}:{file_id}:{folder_id or 'root'}"
+
+
+def transfer_drive_file(source_credentials, dest_credentials, file_id: str,
+                        folder_id: Optional[str] = None, delete_source: bool = False,
+                        streaming: bool = True, same_account: bool = False,
+                        resume_key: Optional[str] = None, dedup: bool = False,
+                        progress_id: Optional[str] = None) -> dict:
+    """
+    Copy one file from the source Drive to the destination Drive.
+
+    When both sides are the same account (`same_account`) the file is
+    copied or moved server-side instead of being downloaded and uploaded.
+    With a `resume_key`, streamed binary transfers checkpoint their upload
+    session in Redis and pick up where an interrupted attempt stopped.
+    With `dedup`, a file whose md5 and size already exist in the target
+    folder is not copied again; the existing file's ID is returned.
+    With a `progress_id`, progress events are published on that channel.
+    Builds its own service objects so it is safe to call from worker
+    threads. Raises on failure; returns a summary dict on success.
+    """
+    reporter = ProgressReporter(progress_id, file_id)
+    try:
+        result = _transfer_drive_file(source_credentials, dest_credentials, file_id, folder_id,
+                                      delete_source, streaming, same_account, resume_key, dedup, reporter)
+    except Exception as e:
+        reporter.failed(e)
+        raise
+    reporter.completed(result)
+    return result
+
+
+def _transfer_drive_file(source_credentials, dest_credentials, file_id: str, folder_id: Optional[str],
+                         delete_source: bool, streaming: bool, same_account: bool,
+                         resume_key: Optional[str], dedup: bool, reporter: ProgressReporter) -> dict:
+    source = get_drive_service(source_credentials)
+    meta = drive_scheduler.execute(source.files().get(fileId=file_id, fields="name, mimeType, size, md5Checksum, parents, version, modifiedTime"))
+    reporter.started(meta["name"], int(meta["size"]) if meta.get("size") else None)
+
+    dest = get_drive_service(dest_credentials)
+
+    checksum = None
+    index_key = None
+    if dedup and meta.get("md5Checksum"):
+        checksum = f"{meta['md5Checksum']}:{meta.get('size')}"
+        index_key, index = folder_checksum_index(dest, folder_id)
+        existing_id = index.get(checksum)
+        if existing_id and not is_dedup_match(dest, existing_id, checksum, index_key):
+            logger.info(f"Cached match {existing_id} for '{meta['name']}' is gone, transferring again")
+            redis_client.remove_checksum_index_entry(index_key, checksum)
+            existing_id = None
+        if existing_id:
+            logger.info(f"Skipping '{meta['name']}', destination already has file {existing_id}")
+            if delete_source and existing_id != file_id:
+                drive_scheduler.execute(source.files().delete(fileId=file_id))
+            return {
+                "message": f"✅ File '{meta['name']}' already present at destination.",
+                "fileName": meta["name"],
+                "destFileId": existing_id,
+                "serverSide": False,
+                "alreadyPresent": True
+            }
+
+    if same_account:
+        result = server_side_transfer(source, file_id, meta, folder_id=folder_id, delete_source=delete_source)
+        if index_key:
+            redis_client.add_checksum_index_entry(index_key, checksum, result["destFileId"])
+        return result
+
+    file_name = meta["name"]
+    mime_type = meta["mimeType"]
+
+    cached = None
+    cache_writer = None
+    content_id = meta.get("md5Checksum")
+
+    # Check if this is a Google Workspace file that needs to be exported
+    if mime_type in EXPORT_TYPES:
+        export_mime_type = EXPORT_TYPES[mime_type]
+
+        # Unchanged documents are served from the export cache instead of re-rendered
+        version = meta.get("version") or meta.get("modifiedTime")
+        cache_key = export_cache.key(file_id, version, export_mime_type)
+        content_id = f"export:{version}"
+        cached = export_cache.open(cache_key)
+
+        if cached:
+            logger.info(f"Using cached {export_mime_type} export of '{file_name}'")
+            request = None
+            file_size = os.fstat(cached.fileno()).st_size
+        else:
+            logger.info(f"Exporting Google Workspace file '{file_name}' from {mime_type} to {export_mime_type}")
+            # Export the file in the appropriate format
+            request = source.files().export_media(fileId=file_id, mimeType=export_mime_type)
+            cache_writer = export_cache.writer(cache_key)
+            file_size = None
+
+        # Update filename with appropriate extension
+        file_name += get_file_extension(export_mime_type)
+
+        # Update mime type for upload
+        upload_mime_type = export_mime_type
+    else:
+        # Regular file download
+        logger.info(f"Downloading regular file '{file_name}' with mime type {mime_type}")
+        request = source.files().get_media(fileId=file_id)
+        upload_mime_type = mime_type
+        file_size = int(meta["size"]) if meta.get("size") else None
+
+    # Prepare the upload
+    body = {"name": file_name}
+    if folder_id:
+        body["parents"] = [folder_id]
+
+    if streaming:
+        if cached:
+            download = cached_file_download(cached)
+        elif cache_writer is not None:
+            download = caching_download(media_download(request), cache_writer)
+        elif file_size is not None and file_size >= PARALLEL_DOWNLOAD_THRESHOLD:
+            # Large binaries use several connections so one file can fill the link
+            download = parallel_ranged_download(source_credentials, file_id, file_size)
+        elif file_size is not None:
+            # Binary files are fetched by byte range so they can resume mid-file
+            download = ranged_download(source, file_id, file_size)
+        else:
+            download = media_download(request)
+
+        upload_uri = None
+        on_checkpoint = None
+        if resume_key and file_size is not None:
+            checkpoint = redis_client.get_transfer_checkpoint(resume_key)
+            if (checkpoint and checkpoint.get("size") == file_size
+                    and checkpoint.get("md5") == content_id):
+                upload_uri = checkpoint["upload_uri"]
+                reporter.resumed_from(checkpoint["uploaded"])
+                logger.info(f"Found checkpoint for '{file_name}' at byte {checkpoint['uploaded']}")
+
+            def save_checkpoint(session_uri, uploaded, downloaded):
+                redis_client.save_transfer_checkpoint(resume_key, {
+                    "upload_uri": session_uri,
+                    "uploaded": uploaded,
+                    "downloaded": downloaded,
+                    "size": file_size,
+                    "md5": content_id
+                })
+            on_checkpoint = save_checkpoint
+
+        # Download and upload overlap through a bounded ring buffer
+        created = stream_transfer(
+            download, dest, body, upload_mime_type,
+            size=file_size,
+            upload_uri=upload_uri,
+            on_checkpoint=on_checkpoint,
+            on_progress=reporter.update
+        )
+        if cached:
+            cached.close()  # Not read at all if the upload session was already complete
+
+        if resume_key:
+            redis_client.delete_transfer_checkpoint(resume_key)
+    elif cached:
+        with cached:
+            media = MediaIoBaseUpload(cached, mimetype=upload_mime_type, resumable=True)
+            created = drive_scheduler.execute(dest.files().create(body=body, media_body=media))
+    else:
+        # Download/export the whole file into memory first
+        fh = io.BytesIO()
+        downloader = MediaIoBaseDownload(fh, request)
+        done = False
+        try:
+            while not done:
+                status, done = drive_scheduler.call(request, downloader.next_chunk)
+                if status:
+                    reporter.update(status.resumable_progress)
+        except BaseException:
+            if cache_writer:
+                cache_writer.discard()
+            raise
+        if cache_writer:
+            cache_writer.write(fh.getvalue())
+            cache_writer.commit()
+        fh.seek(0)
+
+        # Upload to destination
+        media = MediaIoBaseUpload(fh, mimetype=upload_mime_type, resumable=True)
+        created = drive_scheduler.execute(dest.files().create(body=body, media_body=media))
+
+    dest_file_id = created.get("id") if created else None
+    if index_key and dest_file_id:
+        redis_client.add_checksum_index_entry(index_key, checksum, dest_file_id)
+
+    if delete_source:
+        drive_scheduler.execute(source.files().delete(fileId=file_id))
+
+    return {
+        "message": f"✅ File '{file_name}' transferred successfully.",
+        "fileName": file_name,
+        "destFileId": dest_file_id,
+        "serverSide": False,
+        "alreadyPresent": False
+    }
@@ -1,19 +1,13 @@
 import face_recognition
 import json
-import numpy as np
 import os
+from app.face_gallery import face_gallery
 
 def match_face(image_path, threshold=0.6):
-    if not os.path.exists("known_faces.json"):
+    if len(face_gallery) == 0:
         print("❌ No known faces to compare with.")
         return
 
-    with open("known_faces.json", "r") as f:
-        known_faces = json.load(f)
-
-    known_encodings = [np.array(face["encoding"]) for face in known_faces]
-    known_names = [face["name"] for face in known_faces]
-
     # Load new image
     image = face_recognition.load_image_file(image_path)
     new_encodings = face_recognition.face_encodings(image)
@@ -24,12 +18,10 @@ def match_face(image_path, threshold=0.6):
 
     new_encoding = new_encodings[0]
 
-    distances = face_recognition.face_distance(known_encodings, new_encoding)
-    best_index = np.argmin(distances)
+    matched_name, distance = face_gallery.match(new_encoding, threshold)
 
-    if distances[best_index] <= threshold:
-        matched_name = known_names[best_index]
-        print(f"✅ Match found: {matched_name} (distance = {distances[best_index]:.2f})")
+    if matched_name is not None:
+        print(f"✅ Match found: {matched_name} (distance = {distance:.2f})")
 
         # Save to match history
         match_record = {
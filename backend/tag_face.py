@@ -1,6 +1,5 @@
 import face_recognition
-import json
-import os
+from app.face_gallery import face_gallery
 
 def save_face_encoding(image_path, label):
     image = face_recognition.load_image_file(image_path)
@@ -12,22 +11,8 @@ def save_face_encoding(image_path, label):
 
     encoding = encodings[0]
 
-    # Load or create known_faces.json
-    if os.path.exists("known_faces.json"):
-        with open("known_faces.json", "r") as f:
-            known_faces = json.load(f)
-    else:
-        known_faces = []
-
-    # Add this new face
-    known_faces.append({
-        "name": label,
-        "encoding": encoding.tolist()  # NumPy array -> list
-    })
-
-    # Save back to JSON
-    with open("known_faces.json", "w") as f:
-        json.dump(known_faces, f)
+    # Append to the binary gallery; no need to rewrite the existing faces
+    face_gallery.add(label, encoding)
 
     print(f"✅ Saved face for '{label}'.")
 